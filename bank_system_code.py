@@ -1,11 +1,912 @@
+import csv
 import datetime
+import hashlib
+import hmac
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict
 from abc import ABC,abstractmethod
+from contextlib import contextmanager
+from functools import lru_cache, wraps
 
+
+# numpy is optional and only imported when the month-end batch engine first runs, it is slow to import
+@lru_cache(maxsize=None)
+def optional_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+# writing to a temporary file and renaming it over the target, so a crash can never leave a truncated file
+@contextmanager
+def atomic_open(filename, mode='w'):
+    temp_filename = f"{filename}.tmp"
+    try:
+        with open(temp_filename, mode) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_filename, filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+
+
+# opt-in operation counts, latency histograms and persistence I/O totals
+# enable() wraps the methods listed in TIMED and disable() puts the originals back, so while metrics are off
+# the timed methods run exactly as they were written; I/O is counted where files are opened, behind a check of active
+# latencies go in log scale buckets, eight per power of two nanoseconds picked by the three bits after the leading one,
+# so a quantile (the midpoint of its bucket) is within about 6% of the true latency
+class Metrics:
+    active = None
+    TIMED = [] # (class, method name, operation) of the calls timed while metrics are enabled
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations = {} # operation -> [count, total nanoseconds, list of bucket counts]
+        self.io = {"read": [0, 0], "written": [0, 0], "journal": [0, 0]} # direction -> [files or commits, bytes]
+        self.originals = []
+
+    @classmethod
+    def enable(cls):
+        if cls.active is None:
+            cls.active = cls()
+            cls.active.install()
+        return cls.active
+
+    @classmethod
+    def disable(cls):
+        if cls.active is not None:
+            cls.active.uninstall()
+            cls.active = None
+
+    def install(self):
+        for owner, name, operation in self.TIMED:
+            original = owner.__dict__[name]
+            if isinstance(original, staticmethod):
+                setattr(owner, name, staticmethod(self.timed(original.__func__, operation)))
+            else:
+                setattr(owner, name, self.timed(original, operation))
+            self.originals.append((owner, name, original))
+
+    def uninstall(self):
+        for owner, name, original in reversed(self.originals):
+            setattr(owner, name, original)
+        self.originals = []
+
+    def timed(self, function, operation):
+        observe = self.observe
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe(operation, time.perf_counter_ns() - start)
+        return wrapper
+
+    def observe(self, operation, nanoseconds):
+        length = nanoseconds.bit_length()
+        bucket = length << 3 | (nanoseconds >> (length - 4)) & 7 if length > 4 else nanoseconds
+        with self.lock:
+            stats = self.operations.get(operation)
+            if stats is None:
+                stats = self.operations[operation] = [0, 0, [0] * 528]
+            stats[0] += 1
+            stats[1] += nanoseconds
+            stats[2][bucket] += 1
+
+    def record_io(self, direction, size):
+        with self.lock:
+            totals = self.io[direction]
+            totals[0] += 1
+            totals[1] += size
+
+    # latency in seconds below which a fraction q of the calls finished
+    @staticmethod
+    def quantile(buckets, count, q):
+        seen = 0
+        for bucket, bucket_count in enumerate(buckets):
+            seen += bucket_count
+            if bucket_count and seen >= q * count:
+                if bucket < 16: # exact nanoseconds
+                    return bucket / 1e9
+                length, step = bucket >> 3, bucket & 7
+                return ((17 + 2 * step) << (length - 5)) / 1e9
+        return 0.0
+
+    def snapshot(self):
+        with self.lock:
+            operations = {operation: (count, total, list(buckets))
+                          for operation, (count, total, buckets) in self.operations.items()}
+            io = {direction: list(totals) for direction, totals in self.io.items()}
+        result = {"operations": {}, "io": {}}
+        for operation, (count, total, buckets) in sorted(operations.items()):
+            result["operations"][operation] = {
+                "count": count,
+                "total_seconds": total / 1e9,
+                "mean_seconds": total / count / 1e9,
+                **{f"p{round(q * 100)}_seconds": self.quantile(buckets, count, q) for q in self.QUANTILES},
+            }
+        result["io"] = {direction: {"count": count, "bytes": size} for direction, (count, size) in io.items()}
+        return result
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = ["# HELP bank_operation_seconds Latency of banking operations.",
+                 "# TYPE bank_operation_seconds summary"]
+        for operation, stats in snapshot["operations"].items():
+            for q in self.QUANTILES:
+                lines.append(f'bank_operation_seconds{{operation="{operation}",quantile="{q}"}} '
+                             f'{stats[f"p{round(q * 100)}_seconds"]:.9g}')
+            lines.append(f'bank_operation_seconds_sum{{operation="{operation}"}} {stats["total_seconds"]:.9g}')
+            lines.append(f'bank_operation_seconds_count{{operation="{operation}"}} {stats["count"]}')
+        lines += ["# HELP bank_io_operations_total Files read and written, and journal commits.",
+                  "# TYPE bank_io_operations_total counter"]
+        lines += [f'bank_io_operations_total{{direction="{direction}"}} {totals["count"]}'
+                  for direction, totals in snapshot["io"].items()]
+        lines += ["# HELP bank_io_bytes_total Bytes read and written by persistence.",
+                  "# TYPE bank_io_bytes_total counter"]
+        lines += [f'bank_io_bytes_total{{direction="{direction}"}} {totals["bytes"]}'
+                  for direction, totals in snapshot["io"].items()]
+        return "\n".join(lines) + "\n"
+
+    # table for the admin menu
+    def report(self):
+        snapshot = self.snapshot()
+        lines = [f"{'operation':<16} {'count':>8} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"]
+        for operation, stats in snapshot["operations"].items():
+            lines.append(f"{operation:<16} {stats['count']:>8} {stats['mean_seconds'] * 1000:>9.3f} "
+                         f"{stats['p50_seconds'] * 1000:>9.3f} {stats['p95_seconds'] * 1000:>9.3f} "
+                         f"{stats['p99_seconds'] * 1000:>9.3f}")
+        for direction, totals in snapshot["io"].items():
+            lines.append(f"{direction:<16} {totals['count']:>8} {'commits' if direction == 'journal' else 'files'}, "
+                         f"{totals['bytes']} bytes")
+        return "\n".join(lines)
+
+
+# an amount of money as a whole number of cents, so balances never drift the way sums of floats do
+# amounts from the menus, files and requests are converted once by Money.of, to the nearest cent with ties to even
+# rates are taken at their decimal value (2.5 is exactly 5/2) and scaled() rounds the exact result half to even
+# str() gives what str() of the float amount gave, so the files read and written are unchanged
+class Money:
+    __slots__ = ("cents",)
+    MAX_CENTS = 10 ** 15 # largest amount, ten trillion, well inside the 64 bit columns histories keep cents in
+
+    def __init__(self, cents=0):
+        self.cents = cents
+
+    @classmethod
+    def of(cls, amount):
+        if type(amount) is cls:
+            return amount
+        return cls(cls.cents_of(amount))
+
+    # the amount in whole cents, without building a Money for it
+    # amounts beyond MAX_CENTS raise ValueError, before any balance or history is changed
+    @staticmethod
+    def cents_of(amount):
+        if type(amount) is float:
+            # within MAX_CENTS and exactly the float nearest a whole number of cents, so rounding gives that number
+            if -1e13 <= amount <= 1e13:
+                cents = round(amount * 100)
+                if cents / 100 == amount:
+                    return cents
+            elif not math.isfinite(amount):
+                raise ValueError("Amount must be a finite number.")
+        elif type(amount) is Money:
+            return amount.cents
+        if isinstance(amount, int):
+            cents = amount * 100
+        else:
+            numerator, denominator = Money.ratio(amount)
+            cents = Money.divide(numerator * 100, denominator)
+        if not -Money.MAX_CENTS <= cents <= Money.MAX_CENTS:
+            raise ValueError("Amount is too large.")
+        return cents
+
+    # exact value of a rate or amount as (numerator, denominator), taken from its decimal form
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def ratio(value):
+        if isinstance(value, int):
+            return value, 1
+        from decimal import Decimal, InvalidOperation
+        try:
+            numerator, denominator = Decimal(repr(value) if isinstance(value, float) else str(value)).as_integer_ratio()
+        except (InvalidOperation, ValueError, OverflowError):
+            raise ValueError(f"Invalid amount {value!r}.")
+        return numerator, denominator
+
+    # numerator / denominator rounded half to even, denominator must be positive
+    @staticmethod
+    def divide(numerator, denominator):
+        quotient, remainder = divmod(numerator, denominator)
+        if 2 * remainder > denominator or (2 * remainder == denominator and quotient & 1):
+            quotient += 1
+        return quotient
+
+    # self * multiplier / divisor with a single rounding, e.g. a month of interest is balance.scaled(rate, 1200)
+    def scaled(self, multiplier, divisor=1):
+        return Money(self.scale_cents(self.cents, multiplier, divisor))
+
+    # the float result is used when it is not close to half a cent, round() already rounds exact ties to even
+    @staticmethod
+    def scale_cents(cents, multiplier, divisor=1):
+        scaled = cents * multiplier / divisor
+        quotient = round(scaled)
+        if -0.499999 < scaled - quotient < 0.499999 and -1e9 < scaled < 1e9:
+            return quotient
+        numerator, denominator = Money.ratio(multiplier)
+        return Money.divide(cents * numerator, denominator * divisor)
+
+    # scale_cents() over lists of cents and multipliers, as a list
+    # numpy.rint rounds ties to even as round() does, the few results close to half a cent are redone exactly
+    @staticmethod
+    def scaled_array(numpy, cents, multipliers, divisor=1):
+        scaled = numpy.array(cents, dtype=float) * numpy.array(multipliers, dtype=float) / divisor
+        quotients = numpy.rint(scaled)
+        inexact = (numpy.abs(scaled - quotients) >= 0.499999) | (numpy.abs(scaled) >= 1e9)
+        quotients = quotients.astype(numpy.int64).tolist()
+        for index in numpy.flatnonzero(inexact).tolist():
+            quotients[index] = Money.scale_cents(cents[index], multipliers[index], divisor)
+        return quotients
+
+    def __add__(self, other):
+        if type(other) is not Money:
+            other = Money.of(other)
+        return Money(self.cents + other.cents)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if type(other) is not Money:
+            other = Money.of(other)
+        return Money(self.cents - other.cents)
+
+    def __rsub__(self, other):
+        return Money(Money.of(other).cents - self.cents)
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+    def __abs__(self):
+        return Money(abs(self.cents))
+
+    def __mul__(self, factor):
+        return self.scaled(factor)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, divisor):
+        if type(divisor) is Money:
+            return self.cents / divisor.cents
+        numerator, denominator = self.ratio(divisor)
+        if numerator < 0:
+            numerator, denominator = -numerator, -denominator
+        return Money(self.divide(self.cents * denominator, numerator))
+
+    # comparisons with plain numbers compare against the float amount, as float balances did
+    def __eq__(self, other):
+        if type(other) is Money:
+            return self.cents == other.cents
+        if isinstance(other, (int, float)):
+            return self.cents / 100 == other
+        return NotImplemented
+
+    def __lt__(self, other):
+        if type(other) is Money:
+            return self.cents < other.cents
+        return self.cents / 100 < other
+
+    def __le__(self, other):
+        if type(other) is Money:
+            return self.cents <= other.cents
+        return self.cents / 100 <= other
+
+    def __gt__(self, other):
+        if type(other) is Money:
+            return self.cents > other.cents
+        return self.cents / 100 > other
+
+    def __ge__(self, other):
+        if type(other) is Money:
+            return self.cents >= other.cents
+        return self.cents / 100 >= other
+
+    def __hash__(self):
+        return hash(self.cents / 100)
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __float__(self):
+        return self.cents / 100
+
+    def __str__(self):
+        return str(self.cents / 100)
+
+    def __format__(self, spec):
+        return format(self.cents / 100, spec)
+
+    def __repr__(self):
+        return f"Money({self})"
+
+
+# the fixed width "YYYY-MM-DD HH:MM:SS" timestamps of the ledger files, to and from seconds since 1970-01-01
+# without datetime or strptime: the date is converted once per distinct day and cached, the time of day is
+# looked up in per-minute and per-second tables, so formatting or parsing a second is a few dict/list lookups
+# "@<seconds>" is also read, and written instead of the text form when epoch_on_disk is set; files written that
+# way can not be read by versions before it, so the text form stays the default
+class TimestampCodec:
+    FORMAT = "%Y-%m-%d %H:%M:%S"
+    EPOCH_DATE = datetime.date(1970, 1, 1)
+    MINUTE_TEXTS = [f"{hour:02d}:{minute:02d}:" for hour in range(24) for minute in range(60)] # minute of day -> "HH:MM:"
+    SECOND_TEXTS = [f"{second:02d}" for second in range(60)]
+    MINUTE_SECONDS = {text: minute * 60 for minute, text in enumerate(MINUTE_TEXTS)}
+    SECOND_VALUES = {text: second for second, text in enumerate(SECOND_TEXTS)}
+    day_texts = {} # days since 1970-01-01 -> "YYYY-MM-DD "
+    day_seconds = {} # "YYYY-MM-DD " -> seconds at midnight
+    epoch_on_disk = False
+
+    @classmethod
+    def parse(cls, text):
+        try:
+            return cls.day_seconds[text[:11]] + cls.MINUTE_SECONDS[text[11:17]] + cls.SECOND_VALUES[text[17:]]
+        except KeyError: # first timestamp of a day, or not in the canonical form
+            return cls.parse_slow(text)
+
+    @classmethod
+    def parse_slow(cls, text):
+        if text.startswith("@"):
+            return int(text[1:])
+        timestamp = datetime.datetime.strptime(text, cls.FORMAT) # raises ValueError for anything strptime rejects
+        seconds = (timestamp.date() - cls.EPOCH_DATE).days * 86400
+        if len(text) == 19 and cls.format(seconds)[:11] == text[:11]: # only the canonical form is cached
+            cls.day_seconds[text[:11]] = seconds
+        return seconds + timestamp.hour * 3600 + timestamp.minute * 60 + timestamp.second
+
+    @classmethod
+    def format(cls, seconds):
+        days, second = divmod(seconds, 86400)
+        day_text = cls.day_texts.get(days)
+        if day_text is None:
+            day_text = cls.day_texts[days] = (cls.EPOCH_DATE + datetime.timedelta(days=days)).strftime("%Y-%m-%d ")
+        minute, second = divmod(second, 60)
+        return day_text + cls.MINUTE_TEXTS[minute] + cls.SECOND_TEXTS[second]
+
+    # formatter for timestamps written to the ledger files and transaction logs
+    @classmethod
+    def disk_format(cls):
+        if cls.epoch_on_disk:
+            return lambda seconds: f"@{seconds}"
+        return cls.format
+
+
+# compact transaction history, one array per column instead of one dict per transaction
+# timestamps are whole seconds since 1970-01-01, amounts are integer cents and types are interned codes
+class TransactionHistory:
+    __slots__ = ("timestamps", "type_codes", "amounts", "pending", "indexed_rows", "type_index", "time_sorted",
+                 "time_order")
+    EPOCH = datetime.datetime(1970, 1, 1)
+    transaction_types = [] # type code -> transaction type, shared by every history
+    transaction_type_codes = {} # transaction type -> type code
+
+    # pending is (source, offset, count) of columns still in a snapshot or account file, read on first use
+    # the columns are not allocated until then
+    def __init__(self, pending=None):
+        self.pending = pending
+        if pending is None:
+            self.timestamps = array('q')
+            self.type_codes = array('H')
+            self.amounts = array('q')
+        self.reset_indexes()
+
+    # query indexes, built on the first query and extended with the rows appended since
+    def reset_indexes(self):
+        self.indexed_rows = 0
+        self.type_index = None # type code -> ascending positions of that type, created by update_indexes
+        self.time_sorted = True # whether timestamps never go backwards
+        self.time_order = None # positions sorted by timestamp, only needed when time_sorted is False
+
+    # history kept in a snapshot file, its columns are only read when the account is touched
+    @classmethod
+    def from_snapshot(cls, snapshot, offset, count):
+        return cls((snapshot, offset, count) if count else None)
+
+    def load_pending(self):
+        source, offset, count = self.pending
+        self.timestamps, self.type_codes, self.amounts = source.read_history(offset, count)
+        self.pending = None
+
+    # reading the pending history of every account, so that a batch over them fails before it changes any
+    @staticmethod
+    def load_histories(accounts):
+        for account in accounts:
+            history = account.history
+            if history is not None and history.pending:
+                history.load_pending()
+
+    # (count, sum of cents) per type code, taken straight from the columns without building the query indexes
+    # a history still in its file is read for this and left there, so that its columns are not kept
+    def type_totals(self):
+        if self.pending:
+            source, offset, count = self.pending
+            _, type_codes, amounts = source.read_history(offset, count)
+        else:
+            type_codes, amounts = self.type_codes, self.amounts
+        counts = Counter(type_codes)
+        sums = dict.fromkeys(counts, 0)
+        for type_code, cents in zip(type_codes, amounts):
+            sums[type_code] += cents
+        return counts, sums
+
+    # getting the interned code of a transaction type, adding it on first use
+    @classmethod
+    def type_code(cls, transaction_type):
+        code = cls.transaction_type_codes.get(transaction_type)
+        if code is None:
+            code = len(cls.transaction_types)
+            cls.transaction_types.append(transaction_type)
+            cls.transaction_type_codes[transaction_type] = code
+        return code
+
+    @classmethod
+    def seconds(cls, timestamp):
+        return int((timestamp - cls.EPOCH).total_seconds())
+
+    # seconds() of the current local time, worked out once per second of time.time() rather than per transaction
+    now_from = now_until = 0.0
+    now_value = 0
+
+    @classmethod
+    def now_seconds(cls):
+        now = time.time()
+        if not cls.now_from <= now < cls.now_until:
+            second = int(now)
+            cls.now_value = cls.seconds(datetime.datetime.fromtimestamp(second))
+            cls.now_from, cls.now_until = second, second + 1
+        return cls.now_value
+
+    # appending a transaction already converted to seconds, type code and cents
+    # a value a column cannot hold raises with all three columns left as they were
+    def append_encoded(self, seconds, type_code, cents):
+        if self.pending:
+            self.load_pending()
+        amounts, timestamps = self.amounts, self.timestamps
+        amounts.append(cents)
+        try:
+            timestamps.append(seconds)
+            self.type_codes.append(type_code)
+        except (OverflowError, TypeError):
+            del amounts[len(self.type_codes):]
+            del timestamps[len(self.type_codes):]
+            raise
+
+    def __len__(self):
+        if self.pending:
+            return self.pending[2]
+        return len(self.timestamps)
+
+    # iterating (timestamp, type, amount) tuples from position start, without building dicts
+    def rows(self, start=0):
+        if self.pending:
+            self.load_pending()
+        epoch, timedelta, transaction_types = self.EPOCH, datetime.timedelta, self.transaction_types
+        for index in range(start, len(self.timestamps)):
+            yield (epoch + timedelta(seconds=self.timestamps[index]),
+                   transaction_types[self.type_codes[index]],
+                   self.amounts[index] / 100)
+
+    # iterating (timestamp text, type, amount) tuples, timestamps formatted by format without building datetimes
+    def formatted_rows(self, start=0, format=TimestampCodec.format):
+        if self.pending:
+            self.load_pending()
+        transaction_types = self.transaction_types
+        for index in range(start, len(self.timestamps)):
+            yield format(self.timestamps[index]), transaction_types[self.type_codes[index]], self.amounts[index] / 100
+
+    # transactions are still readable as dicts, built only when asked for
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("transaction index out of range")
+        timestamp, transaction_type, amount = next(self.rows(index))
+        return {"timestamp": timestamp, "type": transaction_type, "amount": amount}
+
+    def __iter__(self):
+        for timestamp, transaction_type, amount in self.rows():
+            yield {"timestamp": timestamp, "type": transaction_type, "amount": amount}
+
+    def update_indexes(self):
+        if self.pending:
+            self.load_pending()
+        if self.type_index is None:
+            self.type_index = {}
+        timestamps, type_codes, type_index = self.timestamps, self.type_codes, self.type_index
+        start, end = self.indexed_rows, len(timestamps)
+        if start == end:
+            return
+        for index in range(start, end):
+            positions = type_index.get(type_codes[index])
+            if positions is None:
+                positions = type_index[type_codes[index]] = array('q')
+            positions.append(index)
+        if self.time_sorted and any(timestamps[index] < timestamps[index - 1] for index in range(max(start, 1), end)):
+            self.time_sorted = False
+        if not self.time_sorted:
+            self.time_order = array('q', sorted(range(end), key=timestamps.__getitem__))
+        self.indexed_rows = end
+
+    # positions of the transactions in [start, end) seconds, of one type code and within [min_cents, max_cents]
+    # in timestamp order; the time range and type are found by bisecting the indexes, amounts are checked per row
+    def query(self, start=None, end=None, type_code=None, min_cents=None, max_cents=None):
+        self.update_indexes()
+        timestamps = self.timestamps
+        if self.time_sorted:
+            low = 0 if start is None else bisect_left(timestamps, start)
+            high = len(timestamps) if end is None else bisect_left(timestamps, end)
+            if type_code is None:
+                positions = range(low, high)
+            else:
+                type_positions = self.type_index.get(type_code, ())
+                positions = type_positions[bisect_left(type_positions, low):bisect_left(type_positions, high)]
+        else:
+            time_order = self.time_order
+            low = 0 if start is None else bisect_left(time_order, start, key=timestamps.__getitem__)
+            high = len(time_order) if end is None else bisect_left(time_order, end, key=timestamps.__getitem__)
+            positions = time_order[low:high]
+            if type_code is not None:
+                type_codes = self.type_codes
+                positions = [position for position in positions if type_codes[position] == type_code]
+        if min_cents is not None or max_cents is not None:
+            amounts = self.amounts
+            min_cents = -2 ** 63 if min_cents is None else min_cents
+            max_cents = 2 ** 63 if max_cents is None else max_cents
+            positions = [position for position in positions if min_cents <= amounts[position] <= max_cents]
+        return positions
+
+    def row(self, index):
+        return (self.EPOCH + datetime.timedelta(seconds=self.timestamps[index]),
+                self.transaction_types[self.type_codes[index]],
+                self.amounts[index] / 100)
+
+    # a pickled history carries the type names its codes refer to, another process may intern types differently
+    def __getstate__(self):
+        if self.pending:
+            self.load_pending()
+        return self.timestamps, self.type_codes, self.amounts, self.transaction_types
+
+    def __setstate__(self, state):
+        self.timestamps, self.type_codes, self.amounts, transaction_types = state
+        self.pending = None
+        self.reset_indexes()
+        if transaction_types != self.transaction_types[:len(transaction_types)]:
+            type_codes = [self.type_code(transaction_type) for transaction_type in transaction_types]
+            self.type_codes = array('H', (type_codes[code] for code in self.type_codes))
+
+
+# write-ahead journal of every new transaction, opened account and registered customer, shared by the bank
+# lines are appended to a buffer and a background thread writes and fsyncs them in groups: it waits up to
+# commit_window seconds after the first buffered line so that concurrent writers share one fsync
+# transaction lines: account number, position in history, balance after it, seconds, type, cents (tab separated)
+# other lines: "A" or "C" and a JSON object describing the opened account or registered customer
+class TransactionJournal:
+    active = None # journal that add_transaction writes to, None when journaling is off
+
+    def __init__(self, filename, commit_window=0.005, max_batch=10000):
+        self.filename = filename
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+        self.file = open(filename, 'a')
+        self.buffer = []
+        self.appended = 0 # sequence number of the last buffered line
+        self.committed = 0 # sequence number of the last line on disk
+        self.written = 0 # sequence number of the last line in the file, changed only under write_lock
+        self.first_sequence = 0 # sequence number of the line before the first one in the file
+        self.customers_registered = False # a registration is journaled but customers.txt is not rewritten yet
+        self.async_waiters = [] # (sequence number, loop, future) of coroutines waiting for a commit
+        self.closed = False
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name="journal", daemon=True)
+        self.thread.start()
+
+    def append(self, line):
+        with self.condition:
+            self.buffer.append(line)
+            self.appended += 1
+            if len(self.buffer) == 1 or len(self.buffer) >= self.max_batch:
+                self.condition.notify_all()
+            return self.appended
+
+    def record_transaction(self, account, seconds, transaction_type, cents):
+        position = len(account.transaction_history) - 1
+        return self.append(f"{account.account_number}\t{position}\t{account.balance}\t{seconds}\t{transaction_type}\t{cents}\n")
+
+    def record_account(self, customer, account_type, account_number, kwargs):
+        record = {"username": customer.username, "account_type": account_type, "account_number": account_number,
+                  "kwargs": kwargs}
+        return self.append(f"A\t{json.dumps(record)}\n")
+
+    def record_customer(self, customer):
+        record = {"username": customer.username, "password": customer.password, "first_name": customer.first_name,
+                  "last_name": customer.last_name, "address": customer.address}
+        self.customers_registered = True
+        return self.append(f"C\t{json.dumps(record)}\n")
+
+    # background group commit loop
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.buffer and not self.closed:
+                    self.condition.wait()
+                if not self.buffer:
+                    return
+                deadline = time.monotonic() + self.commit_window
+                while len(self.buffer) < self.max_batch and not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                lines, self.buffer = self.buffer, []
+                sequence = self.appended
+            with self.write_lock:
+                data = "".join(lines)
+                self.file.write(data)
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.written = sequence
+            if Metrics.active is not None:
+                Metrics.active.record_io("journal", len(data.encode()))
+            with self.condition:
+                self.committed = sequence
+                self.condition.notify_all()
+                waiters, self.async_waiters = self.async_waiters, []
+            for waiter in waiters:
+                if waiter[0] <= sequence:
+                    waiter[1].call_soon_threadsafe(self.resolve, waiter[2])
+                else:
+                    self.async_waiters.append(waiter)
+
+    @staticmethod
+    def resolve(future):
+        if not future.done():
+            future.set_result(None)
+
+    # blocking until everything up to a sequence number, by default everything appended so far, is on disk
+    def wait(self, sequence=None):
+        with self.condition:
+            sequence = self.appended if sequence is None else sequence
+            while self.committed < sequence:
+                self.condition.wait()
+
+    # awaitable version of wait for the asyncio server
+    def wait_async(self, sequence=None):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.condition:
+            sequence = self.appended if sequence is None else sequence
+            if self.committed >= sequence:
+                future.set_result(None)
+            else:
+                self.async_waiters.append((sequence, loop, future))
+        return future
+
+    # emptying the journal once everything in it is saved in the customer files
+    # with a sequence number only the lines up to it are dropped, lines journaled since are kept in a new file
+    # that replaces the old one, for callers that keep journaling while they save
+    def truncate(self, sequence=None):
+        if sequence is not None:
+            return self.truncate_to(sequence)
+        self.wait()
+        with self.write_lock:
+            self.file.seek(0)
+            self.file.truncate()
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.first_sequence = self.written
+        self.customers_registered = False
+
+    def truncate_to(self, sequence):
+        self.wait(sequence)
+        with self.write_lock:
+            if sequence <= self.first_sequence:
+                return
+            with open(self.filename) as file:
+                kept = file.readlines()[sequence - self.first_sequence:]
+            with atomic_open(self.filename) as file:
+                file.writelines(kept)
+            self.file.close()
+            self.file = open(self.filename, 'a')
+            self.first_sequence = sequence
+            with self.condition: # registrations still in the journal are not in the registry yet
+                self.customers_registered = any(line.startswith("C\t") for line in kept + self.buffer)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        self.file.close()
+        if TransactionJournal.active is self:
+            TransactionJournal.active = None
+
+    # reading journal lines back, stopping at a line cut off by a crash
+    @staticmethod
+    def read(filename):
+        try:
+            with open(filename, 'r') as file:
+                for line in file:
+                    if not line.endswith("\n"):
+                        break
+                    if line.startswith(("A\t", "C\t")):
+                        yield line[0], json.loads(line[2:])
+                        continue
+                    parts = line[:-1].rsplit("\t", 5)
+                    if len(parts) != 6:
+                        break
+                    account_number, position, balance, seconds, transaction_type, cents = parts
+                    yield "T", (account_number, int(position), float(balance), int(seconds), transaction_type, int(cents))
+        except FileNotFoundError:
+            pass
+
+
+# salted password hashes, stored as "scrypt$n$r$p$salt$key" or "pbkdf2_sha256$iterations$salt$key" (hex salt and key)
+# cost is scrypt's n or the number of PBKDF2 iterations, hashes made with another cost are upgraded at the next login
+# hashlib releases the GIL while deriving, so verification runs in a thread pool and uses every core
+# successful logins are cached for cache_ttl seconds, keyed by the stored hash with a keyed digest of the password
+class PasswordHasher:
+    ALGORITHMS = ("scrypt", "pbkdf2_sha256")
+    active = None # hasher used by customers and the admin login
+
+    def __init__(self, algorithm="scrypt", cost=2 ** 14, workers=None, cache_size=10000, cache_ttl=300.0):
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError("Invalid password hash algorithm.")
+        self.algorithm = algorithm
+        self.cost = cost
+        self.workers = workers
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.cache = OrderedDict() # stored hash -> (password digest, expiry), least recently used first
+        self.cache_key = os.urandom(32) # a cached digest is useless outside this process
+        self.lock = threading.Lock()
+        self.pool = None
+
+    @staticmethod
+    def is_hashed(value):
+        return value.startswith(("scrypt$", "pbkdf2_sha256$"))
+
+    @staticmethod
+    def derive(password, algorithm, settings, salt):
+        if algorithm == "scrypt":
+            n, r, p = settings
+            return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + (1 << 20), dklen=32)
+        (iterations,) = settings
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+
+    def settings(self):
+        return (self.cost, 8, 1) if self.algorithm == "scrypt" else (self.cost,)
+
+    def hash(self, password):
+        salt = os.urandom(16)
+        settings = self.settings()
+        key = self.derive(password, self.algorithm, settings, salt)
+        return "$".join([self.algorithm, *map(str, settings), salt.hex(), key.hex()])
+
+    # hashing many passwords at once, spread over the thread pool
+    def hash_many(self, passwords):
+        if len(passwords) < 2:
+            return [self.hash(password) for password in passwords]
+        return list(self.executor().map(self.hash, passwords))
+
+    def verify(self, password, encoded):
+        if not self.is_hashed(encoded): # a plaintext password not migrated yet
+            return hmac.compare_digest(password.encode(), encoded.encode())
+        digest = hmac.digest(self.cache_key, password.encode(), "sha256")
+        now = time.monotonic()
+        # only a matching entry is answered from the cache, a wrong guess still pays for the full derivation
+        with self.lock:
+            cached = self.cache.get(encoded)
+            if cached is not None and cached[1] > now and hmac.compare_digest(cached[0], digest):
+                self.cache.move_to_end(encoded)
+                return True
+        try:
+            algorithm, *settings, salt, key = encoded.split("$")
+            derived = self.derive(password, algorithm, tuple(map(int, settings)), bytes.fromhex(salt))
+            key = bytes.fromhex(key)
+        except (ValueError, TypeError, OverflowError): # damaged hash
+            return False
+        if not hmac.compare_digest(derived, key):
+            return False
+        if self.cache_size:
+            with self.lock:
+                self.cache[encoded] = (digest, now + self.cache_ttl)
+                self.cache.move_to_end(encoded)
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return True
+
+    # whether a stored password is plaintext or hashed with other settings than this hasher's
+    def needs_rehash(self, encoded):
+        return not encoded.startswith("$".join([self.algorithm, *map(str, self.settings())]) + "$")
+
+    # replacing plaintext passwords of loaded customers with hashes, returns how many were replaced
+    def migrate(self, customers):
+        plaintext = [customer for customer in customers if not self.is_hashed(customer.password)]
+        for customer, encoded in zip(plaintext, self.hash_many([customer.password for customer in plaintext])):
+            customer.password = encoded
+        return len(plaintext)
+
+    def executor(self):
+        if self.pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.pool = ThreadPoolExecutor(self.workers or os.cpu_count(), thread_name_prefix="password")
+        return self.pool
+
+    # running a slow credential check in the thread pool so the event loop keeps serving other sessions
+    def run_async(self, function, *args):
+        import asyncio
+        return asyncio.get_running_loop().run_in_executor(self.executor(), function, *args)
+
+
+PasswordHasher.active = PasswordHasher()
+
+
+# accounts and customers are slotted, the whole customer base is kept in memory
 class Account(ABC):
+    __slots__ = ("account_number", "balance_cents", "history", "dirty", "saved_transactions", "type_counts",
+                 "type_sums", "min_balance_cents", "max_balance_cents")
+
     def __init__(self, account_number, balance=0):
         self.account_number = account_number
-        self.balance = balance
-        self.transaction_history = []
+        self.balance_cents = Money.cents_of(balance) # the balance is kept in cents, balance gives it as Money
+        self.history = None # created on first use, most accounts are never touched between loading and saving
+        self.dirty = True # account has changes that are not saved to file yet
+        self.saved_transactions = None # number of transactions already on disk, None if account is not in the file yet
+        # running statistics, counts and sums are None until rebuilt from the history when the account was loaded
+        # without them, the balance range is kept from the balance at load on and never rebuilt
+        self.type_counts = {} # transaction type -> number of transactions
+        self.type_sums = {} # transaction type -> total amount in cents
+        self.min_balance_cents = self.max_balance_cents = self.balance_cents
+
+    @property
+    def balance(self):
+        return Money(self.balance_cents)
+
+    @balance.setter
+    def balance(self, balance):
+        self.balance_cents = Money.cents_of(balance)
+
+    @property
+    def transaction_history(self):
+        if self.history is None:
+            self.history = TransactionHistory()
+        return self.history
+
+    @transaction_history.setter
+    def transaction_history(self, history):
+        self.history = history
 
     @abstractmethod
     def deposit(self):
@@ -18,62 +919,126 @@ class Account(ABC):
     def balance_enquiry(self):
         return self.balance
     #method for record transaction history
-    def add_transaction(self, transaction_type, amount):
-        transaction = {
-            "timestamp": datetime.datetime.now(),# transaction date and time
-            "type": transaction_type,
-            "amount": amount
+    def add_transaction(self, transaction_type, amount, timestamp=None):
+        self.add_encoded_transaction(transaction_type, Money.cents_of(amount), timestamp)
+    #recording a transaction whose amount is already in cents, changing the balance by balance_change cents
+    #the history row is appended first, so a history that cannot be read or extended leaves the balance as it was
+    def add_encoded_transaction(self, transaction_type, cents, timestamp=None, balance_change=0):
+        history = self.transaction_history
+        seconds = history.seconds(timestamp) if timestamp else history.now_seconds() # transaction date and time
+        type_code = history.transaction_type_codes.get(transaction_type)
+        history.append_encoded(seconds, history.type_code(transaction_type) if type_code is None else type_code, cents)
+        self.balance_cents += balance_change
+        self.record_statistics(transaction_type, cents)
+        self.dirty = True
+        if TransactionJournal.active is not None:
+            TransactionJournal.active.record_transaction(self, seconds, transaction_type, cents)
+    #adding a transaction read back from a file, it is neither new nor journaled
+    #the timestamp is in seconds since 1970-01-01, as parse_account_details returns it
+    def load_transaction(self, transaction_type, amount, timestamp):
+        history = self.transaction_history
+        cents = Money.cents_of(amount)
+        history.append_encoded(timestamp, history.type_code(transaction_type), cents)
+        self.record_statistics(transaction_type, cents)
+    #updating the running statistics with a transaction just recorded, the balance already includes it
+    def record_statistics(self, transaction_type, cents):
+        if self.balance_cents < self.min_balance_cents:
+            self.min_balance_cents = self.balance_cents
+        elif self.balance_cents > self.max_balance_cents:
+            self.max_balance_cents = self.balance_cents
+        if self.type_counts is None: # counted when rebuilt from the history, which holds this transaction
+            return
+        self.type_counts[transaction_type] = self.type_counts.get(transaction_type, 0) + 1
+        self.type_sums[transaction_type] = self.type_sums.get(transaction_type, 0) + cents
+    #rebuilding the counts and sums in one pass over the history, the balance range is kept as recorded since loading
+    def rebuild_statistics(self):
+        counts, sums = self.transaction_history.type_totals()
+        transaction_types = TransactionHistory.transaction_types
+        self.type_counts = {transaction_types[type_code]: count for type_code, count in counts.items()}
+        self.type_sums = {transaction_types[type_code]: sums[type_code] for type_code in counts}
+    #counts, totals and balance range of the account without walking the history
+    def get_statistics(self):
+        if self.type_counts is None:
+            self.rebuild_statistics()
+        return {
+            "transactions": sum(self.type_counts.values()),
+            "counts": dict(self.type_counts),
+            "sums": {transaction_type: cents / 100 for transaction_type, cents in self.type_sums.items()},
+            "deposits": self.type_sums.get("Deposit", 0) / 100,
+            "withdrawals": (self.type_sums.get("Withdrawal", 0) + self.type_sums.get("Withdrawal (Overdraft)", 0)) / 100,
+            "overdrafts": self.type_counts.get("Withdrawal (Overdraft)", 0),
+            "interest_earned": self.type_sums.get("Interest Credit", 0) / 100,
+            "balance": self.balance,
+            "min_balance": Money(self.min_balance_cents),
+            "max_balance": Money(self.max_balance_cents),
         }
-        self.transaction_history.append(transaction)
+    #marking everything in memory as written to file
+    def mark_saved(self):
+        self.saved_transactions = 0 if self.history is None else len(self.history)
+        self.dirty = False
     #method for getting transaction history
+    #a history loaded from a snapshot or account file reads its transactions the first time they are used
     def get_transaction_history(self):
         return self.transaction_history
 
+    # transactions in [start, end), of one type and with amount between min_amount and max_amount, oldest first
+    # results are paginated with offset and limit, any filter left as None is not applied
+    def query_transactions(self, start=None, end=None, transaction_type=None, min_amount=None, max_amount=None,
+                           offset=0, limit=None):
+        history = self.transaction_history
+        type_code = None
+        if transaction_type is not None:
+            type_code = history.transaction_type_codes.get(transaction_type)
+            if type_code is None: # type never recorded anywhere
+                return []
+        # bounds are rounded inwards to whole seconds and cents, the units the history is stored in
+        positions = history.query(
+            None if start is None else math.ceil((start - history.EPOCH).total_seconds()),
+            None if end is None else math.ceil((end - history.EPOCH).total_seconds()),
+            type_code,
+            None if min_amount is None else math.ceil(round(min_amount * 100, 6)),
+            None if max_amount is None else math.floor(round(max_amount * 100, 6)))
+        transactions = []
+        for position in positions[offset:None if limit is None else offset + limit]:
+            timestamp, transaction_type, amount = history.row(position)
+            transactions.append({"timestamp": timestamp, "type": transaction_type, "amount": amount})
+        return transactions
+
     #loading transaction history from file
     def load_transaction_history_from_file(self, lines):
-        transaction_history_started = False
-        acc_match = False
-        for line in lines:
-            if line.startswith("Account Number:") and not (self.account_number == line.strip().split(": ")[1]):
-                acc_match = False # Transaction history is not of req:d account
-            elif line.startswith("Account Number:") and (self.account_number == line.strip().split(": ")[1]):
-                acc_match = True #transaction history is of req:d account
-            if line.startswith("Transaction History:"):
-                transaction_history_started = True
-            elif acc_match and transaction_history_started and line.strip() != "":
-                transaction_parts = line.strip().split(" - ")
-                if len(transaction_parts) >= 2:
-                    timestamp = datetime.datetime.strptime(transaction_parts[0], "%Y-%m-%d %H:%M:%S")
-                    transaction_type, amount = transaction_parts[1].split(": ")
-                    amount = float(amount)
-                    self.add_transaction(transaction_type, amount)
+        for account_details, transactions in BankingSystem.parse_account_details(lines):
+            if account_details.get("account_number") == self.account_number:
+                for timestamp, transaction_type, amount in transactions:
+                    self.load_transaction(transaction_type, amount, timestamp)
 
 
 class CheckingAccount(Account):
+    __slots__ = ("credit_limit", "overdraft_fee")
+
     def __init__(self, account_number, balance=0, credit_limit=0, overdraft_fee=0):
         super().__init__(account_number, balance)
-        self.credit_limit = credit_limit
-        self.overdraft_fee = overdraft_fee
-
-    def deposit(self, amount):
-        self.balance += amount  # adding deposit amount in balance
-        self.add_transaction("Deposit", amount)
-        print("Deposit successful!")
-        print(f"Updated balance: {self.balance_enquiry()}")
-
-    def withdraw(self, amount):
-        if self.balance + self.credit_limit >= amount:  # checking is withdrawl amount less than account balance plus credit limit
-            if self.balance >= amount:  # Checking is amount to be withdraw greater than balance
-                self.balance -= amount  # subtracting withdraw amount from account balance
-                self.add_transaction("Withdrawal", -amount)  # Saving transaction history
-            else:  # if balance is less than amount to be withdraw than customer can withdraw from credit limit
-                overdraft_amount = amount - self.balance
-                self.balance = 0
-                self.balance -= overdraft_amount  # subtracting credit limit amount which was withdraw from account balance
-                self.balance -= self.overdraft_fee  # subtracting credit_limit fees from account balance
-                self.add_transaction("Withdrawal (Overdraft)", -amount)  # saving transaction history
-            print("Withdrawal successful!")
+        self.credit_limit = Money.of(credit_limit)
+        self.overdraft_fee = Money.of(overdraft_fee)
+
+    def deposit(self, amount, quiet=False):
+        cents = Money.cents_of(amount)
+        self.add_encoded_transaction("Deposit", cents, balance_change=cents)  # adding deposit amount in balance
+        if not quiet:
+            print("Deposit successful!")
             print(f"Updated balance: {self.balance_enquiry()}")
+
+    def withdraw(self, amount, quiet=False):
+        cents = Money.cents_of(amount)
+        if self.balance_cents + self.credit_limit.cents >= cents:  # checking is withdrawl amount less than account balance plus credit limit
+            if self.balance_cents >= cents:  # Checking is amount to be withdraw greater than balance
+                self.add_encoded_transaction("Withdrawal", -cents, balance_change=-cents)  # subtracting withdraw amount from account balance
+            else:  # if balance is less than amount to be withdraw than customer can withdraw from credit limit
+                # the balance goes below zero by what the balance did not cover, less the overdraft fee
+                self.add_encoded_transaction("Withdrawal (Overdraft)", -cents,
+                                             balance_change=-cents - self.overdraft_fee.cents)
+            if not quiet:
+                print("Withdrawal successful!")
+                print(f"Updated balance: {self.balance_enquiry()}")
         else:  # if withdraw amount is greater than balance plus credit limit
             raise ValueError("Insufficient balance with credit limit.")
 
@@ -82,72 +1047,179 @@ class CheckingAccount(Account):
 
 
 class SavingAccount(Account):
+    __slots__ = ("interest_rate",)
+
     def __init__(self, account_number, balance, interest_rate=10):
         super().__init__(account_number, balance)
         self.interest_rate = interest_rate
 
-    def deposit(self, amount):
-        self.balance += amount #adding deposit amount in balance
-        self.add_transaction("Deposit", amount)
-        print("Deposit successful!")
-        print(f"Updated balance: {self.balance_enquiry()}")
-
-    def withdraw(self, amount):
-        if self.balance >= amount:# Checking is amount to be withdraw greater than balance
-            self.balance -= amount #subracting withdrawl amount from balance
-            self.add_transaction("Withdrawal", -amount)# Saving transaction history
-            print("Withdrawal successful!")
+    def deposit(self, amount, quiet=False):
+        cents = Money.cents_of(amount)
+        self.add_encoded_transaction("Deposit", cents, balance_change=cents) #adding deposit amount in balance
+        if not quiet:
+            print("Deposit successful!")
             print(f"Updated balance: {self.balance_enquiry()}")
+
+    def withdraw(self, amount, quiet=False):
+        cents = Money.cents_of(amount)
+        if self.balance_cents >= cents:# Checking is amount to be withdraw greater than balance
+            self.add_encoded_transaction("Withdrawal", -cents, balance_change=-cents) #subracting withdrawl amount from balance
+            if not quiet:
+                print("Withdrawal successful!")
+                print(f"Updated balance: {self.balance_enquiry()}")
         else:#if amount to be withdraw is less than balance
             raise ValueError("Insufficient balance.")
 
     # calculating how much interest you would be given  in one month in your account balance
+    # balance * rate / 100 / 12 rounded once to the cent, half to even
     def calculate_monthly_interest(self):
-        monthly_interest = self.balance * (self.interest_rate / 100) / 12
+        monthly_interest = self.balance.scaled(self.interest_rate, 1200)
         return monthly_interest
 
     # Adding above calculated interest in account balance
     def credit_interest(self):
-        monthly_interest = self.calculate_monthly_interest()
-        self.balance += monthly_interest
-        self.add_transaction("Interest Credit", monthly_interest)
+        monthly_interest = Money.scale_cents(self.balance_cents, self.interest_rate, 1200)
+        self.add_encoded_transaction("Interest Credit", monthly_interest, balance_change=monthly_interest)
         return self.balance
 
+    # crediting monthly interest to many savings accounts in one pass, same result as credit_interest on each
+    # returns the interest credited to each account, in cents
+    @staticmethod
+    def credit_interest_batch(accounts, timestamp=None):
+        seconds = TransactionHistory.seconds(timestamp or datetime.datetime.now())
+        type_code = TransactionHistory.type_code("Interest Credit")
+        TransactionHistory.load_histories(accounts) # a history that cannot be read fails the batch before any change
+        numpy = optional_numpy()
+        if numpy is not None:
+            cents = Money.scaled_array(numpy, [account.balance_cents for account in accounts],
+                                       [account.interest_rate for account in accounts], 1200)
+        else:
+            cents = [Money.scale_cents(account.balance_cents, account.interest_rate, 1200) for account in accounts]
+        for account, amount in zip(accounts, cents):
+            account.transaction_history.append_encoded(seconds, type_code, amount)
+            account.balance_cents += amount
+            account.record_statistics("Interest Credit", amount)
+            account.dirty = True
+            if TransactionJournal.active is not None:
+                TransactionJournal.active.record_transaction(account, seconds, "Interest Credit", amount)
+        return cents
+
     def __str__(self):
         return f"Savings Account #{self.account_number}"
 
 
 class LoanAccount(Account):
+    __slots__ = ("principal_amount", "interest_rate", "loan_duration", "monthly_payment", "installments_paid")
+
+    # the balance is the principal still owed, it starts at the principal and follows the amortization schedule
     def __init__(self, account_number, principal_amount, interest_rate=10, loan_duration=12):
-        super().__init__(account_number)
-        self.principal_amount = principal_amount # the amount of the loan provided by the banker to the cutomer
+        super().__init__(account_number, principal_amount)
+        self.principal_amount = Money(self.balance_cents) # the amount of the loan provided by the banker to the cutomer
         self.interest_rate = interest_rate
         self.loan_duration = loan_duration
         self.monthly_payment = self.calculate_monthly_payment()
+        self.installments_paid = 0
 
 
-    def deposit(self, amount):
+    def deposit(self, amount, quiet=False):
         print('Sorry! you are not allowed to deposit in Loan account.')
 
-    def withdraw(self, amount):
+    def withdraw(self, amount, quiet=False):
         print('Sorry! You are not allowed to withdraw from Loan account')
 
     #calculating montly payment of loan that customer will pay
     def calculate_monthly_payment(self):
-        monthly_interest_rate = self.interest_rate / 100 / 12
-        num_payments = self.loan_duration
-        annuity_factor = (monthly_interest_rate * (1 + monthly_interest_rate) ** num_payments) / (
-                (1 + monthly_interest_rate) ** num_payments)# calculating how much money will be paid out in the future at specific points of time under an annuity agreement
-        monthly_payment = self.principal_amount * annuity_factor
-        return monthly_payment
+        return LoanAccount.annuity_payment(self.principal_amount, self.interest_rate, self.loan_duration)
+
+    # monthly payment for a loan rounded to the cent, cached because many loans share the same terms
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def annuity_payment(principal_amount, interest_rate, loan_duration):
+        principal_amount = Money.of(principal_amount)
+        monthly_interest_rate = interest_rate / 100 / 12
+        num_payments = loan_duration
+        if monthly_interest_rate == 0:
+            return principal_amount / num_payments if num_payments else principal_amount
+        growth = (1 + monthly_interest_rate) ** num_payments
+        annuity_factor = (monthly_interest_rate * growth) / (growth - 1)# calculating how much money will be paid out in the future at specific points of time under an annuity agreement
+        return Money.of(float(principal_amount) * annuity_factor)
+
+    # full repayment plan, one (interest, principal, remaining balance) tuple per month
+    # schedules are kept in a bounded cache keyed on the loan terms
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def amortization_schedule(principal_amount, interest_rate, loan_duration):
+        monthly_payment = LoanAccount.annuity_payment(principal_amount, interest_rate, loan_duration)
+        remaining = Money.of(principal_amount)
+        schedule = []
+        for month in range(1, loan_duration + 1):
+            interest_payment = remaining.scaled(interest_rate, 1200)
+            principal_payment = monthly_payment - interest_payment
+            if month == loan_duration: # last installment clears whatever rounding left over
+                principal_payment = remaining
+            remaining -= principal_payment
+            schedule.append((interest_payment, principal_payment, remaining))
+        return tuple(schedule)
+
+    def get_amortization_schedule(self):
+        return LoanAccount.amortization_schedule(self.principal_amount, self.interest_rate, self.loan_duration)
+
+    # principal still owed after a number of monthly installments
+    def remaining_balance_after(self, months):
+        if months <= 0:
+            return self.principal_amount
+        schedule = self.get_amortization_schedule()
+        if not schedule:
+            return self.principal_amount
+        return schedule[min(months, len(schedule)) - 1][2]
+
+    # amount that closes the loan today, the principal left after the installments paid so far
+    def payoff_quote(self):
+        return self.remaining_balance_after(self.installments_paid)
+
+    def is_paid_off(self):
+        return self.balance_cents <= 0 or self.installments_paid >= self.loan_duration
+
+    # principal repaid by the next installment, the last one clears whatever rounding left over, as the schedule does
+    def installment_principal(self, interest_payment):
+        if self.installments_paid + 1 >= self.loan_duration:
+            return self.balance_cents
+        return self.monthly_payment.cents - interest_payment
 
     #method for paying loan installment
     def pay_installment(self):
-        interest_payment = self.balance * (self.interest_rate / 100) / 12
-        principal_payment = self.monthly_payment - interest_payment
-        self.balance -= principal_payment
-        self.add_transaction("Loan Installment", -principal_payment)
-        return principal_payment
+        if self.is_paid_off():
+            raise ValueError("Loan is already paid off.")
+        interest_payment = Money.scale_cents(self.balance_cents, self.interest_rate, 1200)
+        principal_payment = self.installment_principal(interest_payment)
+        self.add_encoded_transaction("Loan Installment", -principal_payment, balance_change=-principal_payment)
+        self.installments_paid += 1
+        return Money(principal_payment)
+
+    # paying one installment on many loan accounts in one pass, same result as pay_installment on each
+    # loans already paid off are skipped, returns the principal repaid on each of the others, in cents
+    @staticmethod
+    def pay_installment_batch(accounts, timestamp=None):
+        seconds = TransactionHistory.seconds(timestamp or datetime.datetime.now())
+        type_code = TransactionHistory.type_code("Loan Installment")
+        accounts = [account for account in accounts if not account.is_paid_off()]
+        TransactionHistory.load_histories(accounts) # a history that cannot be read fails the batch before any change
+        numpy = optional_numpy()
+        if numpy is not None:
+            interests = Money.scaled_array(numpy, [account.balance_cents for account in accounts],
+                                           [account.interest_rate for account in accounts], 1200)
+        else:
+            interests = [Money.scale_cents(account.balance_cents, account.interest_rate, 1200) for account in accounts]
+        cents = [-account.installment_principal(interest) for account, interest in zip(accounts, interests)]
+        for account, amount in zip(accounts, cents):
+            account.transaction_history.append_encoded(seconds, type_code, amount)
+            account.balance_cents += amount
+            account.installments_paid += 1
+            account.record_statistics("Loan Installment", amount)
+            account.dirty = True
+            if TransactionJournal.active is not None:
+                TransactionJournal.active.record_transaction(account, seconds, "Loan Installment", amount)
+        return [-amount for amount in cents]
 
     def get_remaining_balance(self):
         return self.balance
@@ -157,6 +1229,9 @@ class LoanAccount(Account):
 
 
 class Customer:
+    __slots__ = ("username", "password", "first_name", "last_name", "address", "accounts", "accounts_by_number",
+                 "accounts_loaded", "banking_system", "snapshot")
+
     def __init__(self, username, password, first_name, last_name, address):
         self.username = username
         self.password = password
@@ -164,8 +1239,23 @@ class Customer:
         self.last_name = last_name
         self.address = address
         self.accounts = []
+        self.accounts_by_number = {} # account number -> account, kept in sync with self.accounts
+        self.accounts_loaded = False # set once the customer's file has been read
+        self.banking_system = None # set when the customer is added to a banking system
+        self.snapshot = None # (snapshot, offset) of the customer's accounts when loaded from a snapshot
+
+    #checking a login password, a plaintext or outdated stored password is replaced by a fresh hash
+    def check_password(self, password):
+        hasher = PasswordHasher.active
+        if not hasher.verify(password, self.password):
+            return False
+        if hasher.needs_rehash(self.password):
+            self.password = hasher.hash(password)
+            if self.banking_system:
+                self.banking_system.registry_changed(self)
+        return True
     #creating customer account
-    def create_account(self, account_type, account_number, **kwargs):
+    def create_account(self, account_type, account_number, quiet=False, **kwargs):
         account = {
             "Checking": CheckingAccount,
             "Savings": SavingAccount,
@@ -174,20 +1264,49 @@ class Customer:
 
         if account: #checking is customer input valid account type or not
             new_account = account(account_number, **kwargs)
-            self.accounts.append(new_account)
-            print("Account created successfully!")
+            self.add_account(new_account)
+            if TransactionJournal.active is not None:
+                TransactionJournal.active.record_account(self, account_type, account_number, kwargs)
+            if not quiet:
+                print("Account created successfully!")
         else:# customer input invalid account type
             raise ValueError("Invalid account type.")
 
+    #adding an account to the customer and to the bank wide account index
+    def add_account(self, account):
+        if account.account_number in self.accounts_by_number:
+            raise ValueError("Account number already exists.")
+        if self.banking_system:
+            self.banking_system.index_account(self, account)
+        self.accounts.append(account)
+        self.accounts_by_number[account.account_number] = account
+
+    #adding an account read back from file, where older files can repeat an account number
+    #such accounts are kept, so that saving does not drop them, and the first one is the one found by number
+    def load_account(self, account):
+        self.accounts.append(account)
+        self.accounts_by_number.setdefault(account.account_number, account)
+        if self.banking_system:
+            self.banking_system.index_loaded_account(self, account)
+
+    #taking back accounts added by a load that failed part way
+    def remove_account(self, account):
+        self.accounts = [other for other in self.accounts if other is not account]
+        if self.accounts_by_number.get(account.account_number) is account:
+            del self.accounts_by_number[account.account_number]
+            for other in self.accounts: # a repeated number now finds the next account with it
+                if other.account_number == account.account_number:
+                    self.accounts_by_number[account.account_number] = other
+                    break
+        if self.banking_system:
+            self.banking_system.unindex_account(account)
+
     def __str__(self):
         return f"Customer: {self.first_name} {self.last_name}"
 
     #searching and getting account by account number
     def get_account_by_number(self, account_number):
-        for account in self.accounts:
-            if account.account_number == account_number:
-                return account
-        return None #if account number not exit
+        return self.accounts_by_number.get(account_number) #None if account number not exit
 
     #printing customer detail
     def view_customer_details(self):
@@ -204,122 +1323,1071 @@ class Customer:
             #printing customer's transacton history
             print("Transaction History:")
             transaction_history = account.get_transaction_history()
-            for transaction in transaction_history:
-                timestamp = transaction['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
-                transaction_type = transaction['type']
-                amount = transaction['amount']
+            for timestamp, transaction_type, amount in transaction_history.formatted_rows():
                 print(f"{timestamp} - {transaction_type}: {amount}")
             print()
 
+# versioned binary snapshot of the whole bank, read through mmap
+# layout (little endian):
+#   header: magic, version, customer count, transaction type count, offset of the history section
+#   transaction type table: one string per type code used in the history section
+#   customers: byte length of one string holding username, password, first name, last name and address of
+#       every customer separated by NUL, then the offset of each customer's account block (uint64 per customer)
+#   account blocks, one per customer
+#   account block: account count, then per account: kind, whether the balance is an int, account number,
+#       balance, four kind specific
+#       values (checking: credit limit, overdraft fee; savings: interest rate; loan: principal, interest
+#       rate, duration, installments paid) and the number and offset of its transactions
+#       version 1 had three, without the installments paid
+#   history section: per account, timestamps (int64), type codes (uint16) and amounts in cents (int64)
+# strings are a uint32 byte length followed by utf-8
+class BankSnapshot:
+    MAGIC = b"NEDBANK\0"
+    VERSION = 2
+    HEADER = struct.Struct("<8sIIIQ")
+    ACCOUNT = struct.Struct("<ddddd QQ")
+    ACCOUNT_STRUCTS = {1: struct.Struct("<dddd QQ"), 2: ACCOUNT} # by version, older snapshots are still read
+    ACCOUNT_KINDS = ["CheckingAccount", "SavingAccount", "LoanAccount"]
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if Metrics.active is not None:
+            Metrics.active.record_io("read", len(self.data))
+        self.mtime = os.path.getmtime(filename)
+        magic, version, self.customer_count, type_count, self.history_offset = self.HEADER.unpack_from(self.data, 0)
+        if magic != self.MAGIC:
+            raise ValueError("Not a bank snapshot.")
+        if version not in self.ACCOUNT_STRUCTS:
+            raise ValueError(f"Unsupported snapshot version {version}.")
+        self.account_struct = self.ACCOUNT_STRUCTS[version]
+        offset = self.HEADER.size
+        # snapshot type codes are mapped onto the type codes of this process
+        self.type_code_map = array('H')
+        for _ in range(type_count):
+            transaction_type, offset = self.read_string(offset)
+            self.type_code_map.append(TransactionHistory.type_code(transaction_type))
+        self.identity_type_codes = list(self.type_code_map) == list(range(type_count))
+        self.customers_offset = offset
+
+    def read_string(self, offset):
+        (length,) = struct.unpack_from("<I", self.data, offset)
+        offset += 4
+        return self.data[offset:offset + length].decode("utf-8"), offset + length
+
+    # reading the customer records only, account blocks are left in the file until the customer logs in
+    def load_customers(self):
+        fields, offset = self.read_string(self.customers_offset)
+        fields = fields.split("\0") if self.customer_count else []
+        account_offsets = array('Q')
+        account_offsets.frombytes(self.data[offset:offset + 8 * self.customer_count])
+        customers = []
+        fields = iter(fields)
+        for username, password, first_name, last_name, address, account_offset in zip(
+                fields, fields, fields, fields, fields, account_offsets):
+            customer = Customer(username, password, first_name, last_name, address)
+            customer.snapshot = (self, account_offset)
+            customers.append(customer)
+        PasswordHasher.active.migrate(customers) # snapshots written before passwords were hashed
+        return customers
+
+    # building the accounts of one customer, their history stays in the file until touched
+    def load_accounts(self, offset):
+        accounts = []
+        (account_count,) = struct.unpack_from("<I", self.data, offset)
+        offset += 4
+        for _ in range(account_count):
+            kind, integer_balance = self.data[offset], self.data[offset + 1]
+            account_number, offset = self.read_string(offset + 2)
+            balance, value1, value2, value3, *value4, count, history_offset = self.account_struct.unpack_from(
+                self.data, offset)
+            offset += self.account_struct.size
+            if integer_balance: # balances never touched by float arithmetic are written as ints in text files
+                balance = int(balance)
+            if kind == 0:
+                account = CheckingAccount(account_number, balance, value1, value2)
+            elif kind == 1:
+                account = SavingAccount(account_number, balance, value1)
+            else:
+                account = LoanAccount(account_number, value1, value2, int(value3))
+                account.balance = Money.of(balance)
+                account.min_balance_cents = account.max_balance_cents = account.balance_cents
+                account.installments_paid = int(value4[0]) if value4 else 0
+            if count:
+                account.transaction_history = TransactionHistory.from_snapshot(self, history_offset, count)
+            account.dirty = False # not changed, but not in the customer's text file yet either
+            account.type_counts = account.type_sums = None # rebuilt from the history if statistics are asked for
+            accounts.append(account)
+        return accounts
+
+    def read_history(self, offset, count):
+        offset += self.history_offset
+        timestamps, type_codes, amounts = array('q'), array('H'), array('q')
+        timestamps.frombytes(self.data[offset:offset + 8 * count])
+        offset += 8 * count
+        type_codes.frombytes(self.data[offset:offset + 2 * count])
+        offset += 2 * count
+        amounts.frombytes(self.data[offset:offset + 8 * count])
+        if not self.identity_type_codes:
+            type_codes = array('H', (self.type_code_map[code] for code in type_codes))
+        return timestamps, type_codes, amounts
+
+    @staticmethod
+    def pack_string(value):
+        value = value.encode("utf-8")
+        return struct.pack("<I", len(value)) + value
+
+    # writing every customer and every loaded account to a new snapshot file
+    @staticmethod
+    def save(customers, filename):
+        pack_string = BankSnapshot.pack_string
+        account_struct = BankSnapshot.ACCOUNT
+        fields = []
+        account_offsets = array('Q')
+        blocks = bytearray()
+        histories = []
+        history_size = 0
+        for customer in customers:
+            fields += [customer.username, customer.password, customer.first_name, customer.last_name, customer.address]
+            account_offsets.append(len(blocks))
+            block = bytearray(struct.pack("<I", len(customer.accounts)))
+            for account in customer.accounts:
+                kind = BankSnapshot.ACCOUNT_KINDS.index(type(account).__name__)
+                if kind == 0:
+                    values = (float(account.credit_limit), float(account.overdraft_fee), 0, 0)
+                elif kind == 1:
+                    values = (account.interest_rate, 0, 0, 0)
+                else:
+                    values = (float(account.principal_amount), account.interest_rate, account.loan_duration,
+                              account.installments_paid)
+                history = account.get_transaction_history()
+                if history.pending:
+                    history.load_pending()
+                block.append(kind)
+                block.append(0) # balances are Money, the int flag is only set by snapshots from before
+                block += pack_string(account.account_number)
+                block += account_struct.pack(float(account.balance), *values, len(history), history_size)
+                histories.append(history)
+                history_size += 18 * len(history)
+            blocks += block
+
+        transaction_types = TransactionHistory.transaction_types
+        type_table = b"".join(pack_string(transaction_type) for transaction_type in transaction_types)
+        fields = pack_string("\0".join(fields))
+        blocks_offset = BankSnapshot.HEADER.size + len(type_table) + len(fields) + 8 * len(account_offsets)
+        account_offsets = array('Q', (blocks_offset + offset for offset in account_offsets))
+        history_offset = blocks_offset + len(blocks)
+        with atomic_open(filename, 'wb') as file:
+            file.write(BankSnapshot.HEADER.pack(BankSnapshot.MAGIC, BankSnapshot.VERSION, len(customers),
+                                                len(transaction_types), history_offset))
+            file.write(type_table)
+            file.write(fields)
+            file.write(account_offsets.tobytes())
+            file.write(blocks)
+            for history in histories:
+                file.write(history.timestamps.tobytes())
+                file.write(history.type_codes.tobytes())
+                file.write(history.amounts.tobytes())
+            if Metrics.active is not None:
+                Metrics.active.record_io("written", file.tell())
+
+
+# a customer's account file whose transaction blocks are parsed when each account's history is first used
+# loading only counts the lines of each block and remembers where it starts, like a snapshot's history section
+# the file is rewritten only by a save, which reads every pending history before replacing it
+class LedgerFile:
+    __slots__ = ("filename", "stat")
+
+    def __init__(self, filename, stat):
+        self.filename = filename
+        self.stat = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    # (seconds since 1970-01-01, type, cents) of a transaction line, ValueError for a line that is not one
+    @staticmethod
+    def parse_line(line):
+        timestamp, transaction = line.decode("utf-8").strip().split(" - ", 1)
+        transaction_type, amount = transaction.rsplit(": ", 1)
+        return TimestampCodec.parse(timestamp), transaction_type, Money.cents_of(float(amount))
+
+    # parsing count transaction lines starting at byte offset into (timestamps, type codes, amounts) columns
+    def read_history(self, offset, count):
+        timestamps, type_codes, amounts = array('q'), array('H'), array('q')
+        with open(self.filename, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            if (stat.st_ino, stat.st_size, stat.st_mtime_ns) != self.stat:
+                raise IOError(f"{self.filename} changed after its accounts were loaded.")
+            file.seek(offset)
+            lines = [file.readline() for _ in range(count)]
+            if Metrics.active is not None:
+                Metrics.active.record_io("read", file.tell() - offset)
+        parse_line, type_code = self.parse_line, TransactionHistory.type_code
+        for line in lines:
+            seconds, transaction_type, cents = parse_line(line)
+            timestamps.append(seconds)
+            type_codes.append(type_code(transaction_type))
+            amounts.append(cents)
+        return timestamps, type_codes, amounts
+
+
+# hash sharded layout for large banks, rooted at directory:
+#   layout                                  number of registry shards, fixed when the layout is created
+#   registry/<shard>.txt                    customers whose username hashes to the shard, rows as in customers.txt
+#   ledgers/<xx>/<yy>/<username>.txt, .log  account file and transaction log, fanned out by the username hash
+# each registry shard is read the first time one of its usernames is needed and rewritten only when one of its
+# customers changed, so a lookup or a registration touches a few thousand rows instead of the whole registry
+class ShardedStorage:
+    LAYOUT = "layout"
+    active = None # where account files and logs are read and written, the working directory when None
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, self.LAYOUT)) as file:
+            self.shards = int(file.read())
+        self.ledger_directories = set() # fan-out directories known to exist
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, ShardedStorage.LAYOUT))
+
+    @staticmethod
+    def create(directory, shards=256):
+        os.makedirs(os.path.join(directory, "registry"), exist_ok=True)
+        with atomic_open(os.path.join(directory, ShardedStorage.LAYOUT)) as file:
+            file.write(f"{shards}\n")
+        return ShardedStorage(directory)
+
+    # stable across processes and runs, unlike hash()
+    @staticmethod
+    def username_hash(username):
+        return hashlib.blake2b(username.encode(), digest_size=8).hexdigest()
+
+    def shard_of(self, username):
+        return int(self.username_hash(username), 16) % self.shards
+
+    def registry_filename(self, shard):
+        return os.path.join(self.directory, "registry", f"{shard:04x}.txt")
+
+    def ledger_filename(self, username, extension=".txt", create=False):
+        digest = self.username_hash(username)
+        directory = os.path.join(self.directory, "ledgers", digest[:2], digest[2:4])
+        if create and directory not in self.ledger_directories:
+            os.makedirs(directory, exist_ok=True)
+            self.ledger_directories.add(directory)
+        return os.path.join(directory, username + extension)
+
+    # moving customers.txt and the account files in the working directory into a new sharded layout
+    # customers.txt is renamed to customers.txt.migrated, so that nothing reads the old registry again
+    @staticmethod
+    def migrate(customers_filename, directory, shards=256):
+        storage = ShardedStorage.create(directory, shards)
+        rows = [[] for _ in range(shards)]
+        usernames = set()
+        with open(customers_filename, 'r') as file:
+            for line in file:
+                username = line.split(",", 1)[0]
+                if username in usernames: # only the first row of a duplicated username is kept, as when loading
+                    continue
+                usernames.add(username)
+                rows[storage.shard_of(username)].append(line if line.endswith("\n") else line + "\n")
+        for shard, shard_rows in enumerate(rows):
+            with atomic_open(storage.registry_filename(shard)) as file:
+                file.writelines(shard_rows)
+        existing = set(os.listdir(".")) # account files are in the working directory in the old layout
+        for username in usernames:
+            for extension in (".txt", ".log"):
+                if username + extension in existing:
+                    os.replace(username + extension, storage.ledger_filename(username, extension, create=True))
+        os.replace(customers_filename, customers_filename + ".migrated")
+        return len(usernames)
+
+
+# a customer's account file or transaction log, in the working directory unless a sharded storage is active
+def ledger_filename(username, extension=".txt", create=False):
+    if ShardedStorage.active is None:
+        return username + extension
+    return ShardedStorage.active.ledger_filename(username, extension, create)
+
+
+# process pool initializer, so that workers read and write ledgers where the parent does
+def use_storage(storage):
+    ShardedStorage.active = storage
+
+
 class BankingSystem:
-    def __init__(self):
-        self.customers = []
+    # customers_filename is only read when customers are first needed
+    def __init__(self, customers_filename=None):
+        self.customers_filename = customers_filename
+        self.registry_filename = customers_filename or "customers.txt"
+        self.customers_by_username = {} # username -> customer
+        self.accounts_by_number = {} # account number -> (customer, account) for every loaded account
+        self.duplicate_account_numbers = [] # (account number, username) of loaded accounts whose number was taken
+        self.account_index_complete = False # every customer's accounts are loaded and in accounts_by_number
+        self._customers = []
+        self.storage = None # sharded registry, set by open_storage
+        self.loaded_shards = set()
+        self.dirty_shards = set() # shards with customers that are not written yet
+        self.registry_dirty = False # customers.txt is behind the customers in memory, without a sharded storage
+        self.shard_customers = {} # shard -> customers in it
+
+    # keeping the registry and every account file in a sharded storage, before any customer is loaded
+    def open_storage(self, directory):
+        self.storage = ShardedStorage.active = ShardedStorage(directory)
+        self.customers_filename = None
+        return self.storage
+
+    #reading the customers file the first time customers are needed
+    def load_customers(self):
+        if self.customers_filename is not None:
+            filename, self.customers_filename = self.customers_filename, None
+            self.customers = self.load_customers_from_file(filename)
+        elif self.storage is not None and len(self.loaded_shards) < self.storage.shards:
+            for shard in range(self.storage.shards):
+                self.load_shard(shard)
+
+    # reading only the part of the registry that can hold username
+    def load_customers_for(self, username):
+        if self.storage is None:
+            self.load_customers()
+        else:
+            self.load_shard(self.storage.shard_of(username))
+
+    def load_shard(self, shard):
+        if shard in self.loaded_shards:
+            return
+        self.loaded_shards.add(shard)
+        for customer in self.load_customers_from_file(self.storage.registry_filename(shard)):
+            self.add_customer(customer)
+
+    def save_shard(self, shard):
+        self.write_customers_file(self.shard_customers.get(shard, []), self.storage.registry_filename(shard))
+        self.dirty_shards.discard(shard)
+
+    # a customer was registered or their row changed, the registry needs writing
+    def registry_changed(self, customer):
+        if self.storage is not None:
+            self.dirty_shards.add(self.storage.shard_of(customer.username))
+        else:
+            self.registry_dirty = True
+
+    # writing the registry: customers.txt in full, or only the changed shards of a sharded storage
+    def write_registry(self):
+        if self.storage is None:
+            self.write_customers_file(self.customers, self.registry_filename)
+            self.registry_dirty = False
+            return
+        for shard in sorted(self.dirty_shards):
+            self.save_shard(shard)
+
+    # writing the registry only when a customer changed, an unchanged customers.txt keeps a newer snapshot in use
+    def save_registry(self):
+        if self.storage is None and not self.registry_dirty:
+            return
+        try:
+            self.write_registry()
+        except IOError:
+            pass
+
+    # assigning the customer list rebuilds both indexes
+    @property
+    def customers(self):
+        self.load_customers()
+        return self._customers
+
+    @customers.setter
+    def customers(self, customers):
+        self.customers_filename = None # an assigned list replaces the file
+        self._customers = []
+        self.customers_by_username = {}
+        self.accounts_by_number = {}
+        self.duplicate_account_numbers = []
+        self.shard_customers = {}
+        if self.storage is not None: # and every shard
+            self.loaded_shards = set(range(self.storage.shards))
+            self.dirty_shards = set(range(self.storage.shards))
+        for customer in customers:
+            self.add_customer(customer)
+
+    #adding a customer to the bank, usernames must be unique
+    def add_customer(self, customer):
+        self.load_customers_for(customer.username)
+        if customer.username in self.customers_by_username:
+            raise ValueError("Username already exists.")
+        for account in customer.accounts:
+            self.index_loaded_account(customer, account)
+        customer.banking_system = self
+        if not customer.accounts_loaded: # its file can hold numbers the index does not have yet
+            self.account_index_complete = False
+        self._customers.append(customer)
+        self.customers_by_username[customer.username] = customer
+        if self.storage is not None:
+            self.shard_customers.setdefault(self.storage.shard_of(customer.username), []).append(customer)
+
+    #adding an account to the bank wide index, account numbers must be unique across customers
+    #including customers whose files are not loaded yet, so every file is loaded before a new number is taken
+    def index_account(self, customer, account):
+        self.load_account_index()
+        if account.account_number in self.accounts_by_number:
+            raise ValueError("Account number already exists.")
+        self.accounts_by_number[account.account_number] = (customer, account)
+
+    #loading every customer file not loaded yet, once, so that accounts_by_number holds every account number
+    #a file that cannot be loaded could hold any number, so no new number is accepted until it can be
+    def load_account_index(self):
+        if self.account_index_complete:
+            return
+        errors = self.load_all_account_details()
+        if errors:
+            raise ValueError(f"Account numbers cannot be checked, the accounts of {len(errors)} customers could not be loaded.")
+        self.account_index_complete = True
+
+    #indexing an account that already exists, a number taken by another account is reported instead of refused
+    def index_loaded_account(self, customer, account):
+        if account.account_number in self.accounts_by_number:
+            self.duplicate_account_numbers.append((account.account_number, customer.username))
+            return
+        self.accounts_by_number[account.account_number] = (customer, account)
+
+    def unindex_account(self, account):
+        entry = self.accounts_by_number.get(account.account_number)
+        if entry is not None and entry[1] is account:
+            del self.accounts_by_number[account.account_number]
 
     def get_customer_by_username(self, username):
-        for customer in self.customers:
-            if customer.username == username:
-                return customer
-        return None
+        customer = self.customers_by_username.get(username)
+        if customer is None: # not loaded yet, or not a customer at all
+            self.load_customers_for(username)
+            customer = self.customers_by_username.get(username)
+        return customer
+
+    #finding any loaded account without knowing its owner, returns (customer, account) or None
+    def get_account_by_number(self, account_number):
+        self.load_customers()
+        return self.accounts_by_number.get(account_number)
 
     # method for loading all customers detail from a single file
     @staticmethod
     def load_customers_from_file(filename):
         customers = []
+        usernames = set()
         try:
             with open(filename, 'r') as file:
                 for line in file:
                     customer_data = line.strip().split(",")
                     username, password, first_name, last_name, address = customer_data
+                    if username in usernames: # only the first row of a duplicated username is kept
+                        continue
+                    usernames.add(username)
                     customer = Customer(username, password, first_name, last_name, address)
                     customers.append(customer)
+                if Metrics.active is not None:
+                    Metrics.active.record_io("read", os.fstat(file.fileno()).st_size)
         except FileNotFoundError: #if file not exit
             pass
+        # rows written before passwords were hashed are hashed now and the file rewritten without them
+        if PasswordHasher.active.migrate(customers):
+            BankingSystem.save_customers_to_file(customers, filename)
         return customers
     # method saving all customer details in a single file
     @staticmethod
     def save_customers_to_file(customers, filename):
         try:
-            with open(filename, 'w') as file:
-                for customer in customers:
-                    customer_data = [
-                        customer.username,
-                        customer.password,
-                        customer.first_name,
-                        customer.last_name,
-                        customer.address
-                    ]
-                    line = ",".join(customer_data) + "\n"
-                    file.write(line)
+            BankingSystem.write_customers_file(customers, filename)
         except IOError:
             pass
+
+    @staticmethod
+    def write_customers_file(customers, filename):
+        with atomic_open(filename) as file:
+            for customer in customers:
+                customer_data = [
+                    customer.username,
+                    customer.password,
+                    customer.first_name,
+                    customer.last_name,
+                    customer.address
+                ]
+                line = ",".join(customer_data) + "\n"
+                file.write(line)
+            if Metrics.active is not None:
+                Metrics.active.record_io("written", file.tell())
+    # writing one customer's accounts and full transaction history in the account file format
+    @staticmethod
+    def write_account_details(customer, file):
+        file.write(f"Customer: {customer.first_name} {customer.last_name}\n")
+        for account in customer.accounts:
+            file.write(f"Account Type: {type(account).__name__}\n")
+            file.write(f"Account Number: {account.account_number}\n")
+            file.write(f"Balance: {account.balance_enquiry()}\n")
+            if isinstance(account, LoanAccount):
+                file.write(f"Principal Amount: {account.principal_amount}\n")
+                file.write(f"Interest Rate: {float(account.interest_rate)}\n")
+                file.write(f"Loan Duration: {account.loan_duration}\n")
+                file.write(f"Installments Paid: {account.installments_paid}\n")
+            file.write("Transaction History:\n")
+            transaction_history = account.get_transaction_history()
+            for timestamp, transaction_type, amount in transaction_history.formatted_rows(0, TimestampCodec.disk_format()):
+                file.write(f"{timestamp} - {transaction_type}: {amount}\n")
+            file.write("\n")
+
+    # rewriting a customer's account file and dropping the transaction log it now includes
+    @staticmethod
+    def save_customer_account_details(customer):
+        filename = ledger_filename(customer.username, create=True)  # Unique file based on username
+        with atomic_open(filename) as file:
+            BankingSystem.write_account_details(customer, file)
+            if Metrics.active is not None:
+                Metrics.active.record_io("written", file.tell())
+        log_filename = ledger_filename(customer.username, ".log")
+        if os.path.exists(log_filename):
+            os.remove(log_filename)
+        for account in customer.accounts:
+            account.mark_saved()
+
+    # appending transactions made since the last save to the customer's transaction log
+    # each line is: account number, position in history, account balance when logged, transaction
+    @staticmethod
+    def append_transaction_log(customer):
+        with open(ledger_filename(customer.username, ".log", create=True), 'a') as file:
+            start = file.tell()
+            for account in customer.accounts:
+                if not account.dirty:
+                    continue
+                position = account.saved_transactions
+                history = account.get_transaction_history()
+                for timestamp, transaction_type, amount in history.formatted_rows(position, TimestampCodec.disk_format()):
+                    file.write(f"{account.account_number}\t{position}\t{account.balance_enquiry()}\t"
+                               f"{timestamp} - {transaction_type}: {amount}\n")
+                    position += 1
+            file.flush()
+            os.fsync(file.fileno())
+            if Metrics.active is not None:
+                Metrics.active.record_io("written", file.tell() - start)
+        for account in customer.accounts:
+            account.mark_saved()
+
+    # replaying a customer's transaction log on top of the accounts read from the account file
+    @staticmethod
+    def replay_transaction_log(customer):
+        try:
+            with open(ledger_filename(customer.username, ".log"), 'r') as file:
+                if Metrics.active is not None:
+                    Metrics.active.record_io("read", os.fstat(file.fileno()).st_size)
+                for line in file:
+                    if not line.endswith("\n"): # last line was cut off by a crash
+                        break
+                    log_parts = line.rstrip("\n").rsplit("\t", 3)
+                    if len(log_parts) != 4:
+                        break
+                    account_number, position, balance, transaction = log_parts
+                    account = customer.get_account_by_number(account_number)
+                    # entries already in the account file are skipped, so replaying twice is harmless
+                    if account is None or int(position) != len(account.transaction_history):
+                        continue
+                    timestamp, transaction = transaction.split(" - ", 1)
+                    transaction_type, amount = transaction.rsplit(": ", 1)
+                    timestamp = TimestampCodec.parse(timestamp)
+                    account.balance = Money.of(float(balance))
+                    account.load_transaction(transaction_type, float(amount), timestamp)
+        except FileNotFoundError:
+            pass
+
     # saving each customer account details and transaction history in separate file
+    # directory names where main keeps a sharded storage, files go wherever ShardedStorage.active puts them
     @staticmethod
     def save_account_details_to_file(customers, directory):
         try:
             for customer in customers:
-                filename = f"{customer.username}.txt"  # Unique file based on username
-                with open(filename, 'w') as file:
-                    file.write(f"Customer: {customer.first_name} {customer.last_name}\n")
-                    for account in customer.accounts:
-                        file.write(f"Account Type: {type(account).__name__}\n")
-                        file.write(f"Account Number: {account.account_number}\n")
-                        file.write(f"Balance: {account.balance_enquiry()}\n")
-                        file.write("Transaction History:\n")
-                        transaction_history = account.get_transaction_history()
-                        for transaction in transaction_history:
-                            timestamp = transaction['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
-                            transaction_type = transaction['type']
-                            amount = transaction['amount']
-                            file.write(f"{timestamp} - {transaction_type}: {amount}\n")
-                        file.write("\n")
+                if not customer.accounts_loaded: # never read, writing it would wipe the file
+                    continue
+                BankingSystem.save_customer_account_details(customer)
         except IOError:
             pass
 
+    # saving only customers with unsaved changes
+    # new accounts need the account file rewritten, otherwise new transactions are appended to the log
+    @staticmethod
+    def save_changed_account_details(customers, directory):
+        try:
+            for customer in customers:
+                BankingSystem.save_changed_customer(customer)
+        except IOError:
+            pass
+
+    @staticmethod
+    def save_changed_customer(customer):
+        if not customer.accounts_loaded:
+            return
+        dirty_accounts = [account for account in customer.accounts if account.dirty]
+        if not dirty_accounts:
+            return
+        if any(account.saved_transactions is None for account in dirty_accounts):
+            BankingSystem.save_customer_account_details(customer)
+        else:
+            BankingSystem.append_transaction_log(customer)
+
+    # turning journaling on, after replaying whatever an earlier run left in the journal
+    def open_journal(self, filename="bank.journal", commit_window=0.005):
+        self.recover_journal(filename)
+        TransactionJournal.active = TransactionJournal(filename, commit_window)
+        return TransactionJournal.active
+
+    # replaying a journal on top of the saved files, then saving the result and emptying the journal
+    # entries already in the files are recognised by their position in the history and skipped
+    def recover_journal(self, filename="bank.journal"):
+        records = list(TransactionJournal.read(filename))
+        if not records:
+            return 0
+        errors = self.load_all_account_details()
+        if errors: # replaying without those accounts and emptying the journal would lose their transactions
+            raise ValueError(f"Journal not replayed, {len(errors)} customer files could not be loaded, "
+                             f"first {errors[0][0]}: {errors[0][1]}")
+        applied = 0
+        customers_registered = False
+        for kind, record in records:
+            if kind == "C":
+                if self.get_customer_by_username(record["username"]) is None:
+                    customer = Customer(record["username"], record["password"], record["first_name"],
+                                        record["last_name"], record["address"])
+                    customer.accounts_loaded = True # a new customer has no file yet
+                    self.add_customer(customer)
+                    self.registry_changed(customer)
+                    customers_registered = True
+                    applied += 1
+            elif kind == "A":
+                customer = self.get_customer_by_username(record["username"])
+                if customer is not None and self.get_account_by_number(record["account_number"]) is None:
+                    customer.create_account(record["account_type"], record["account_number"], quiet=True,
+                                            **record["kwargs"])
+                    applied += 1
+            else:
+                account_number, position, balance, seconds, transaction_type, cents = record
+                found = self.get_account_by_number(account_number)
+                if found is None or position != len(found[1].transaction_history):
+                    continue
+                account = found[1]
+                account.balance = Money.of(balance)
+                account.transaction_history.append_encoded(seconds, TransactionHistory.type_code(transaction_type), cents)
+                account.record_statistics(transaction_type, cents)
+                account.dirty = True
+                applied += 1
+        if customers_registered:
+            self.write_registry()
+        for customer in self.customers:
+            self.save_changed_customer(customer)
+        with open(filename, 'w'):
+            pass
+        return applied
+
+    # saving every change, after which the journal has nothing the files do not and can start over
+    # nothing is truncated unless every file was written
+    def checkpoint(self):
+        journal = TransactionJournal.active
+        try:
+            if journal is not None:
+                journal.wait()
+                if journal.customers_registered:
+                    self.write_registry()
+            for customer in self._customers: # customers never loaded have nothing to save
+                self.save_changed_customer(customer)
+        except (ValueError, IOError): # a history that cannot be read is not saved either
+            return False
+        if journal is not None:
+            journal.truncate()
+        return True
+
+    # registering a new customer, journaled so that a crash before customers.txt is saved does not lose it
+    def add_new_customer(self, customer):
+        if not PasswordHasher.is_hashed(customer.password):
+            customer.password = PasswordHasher.active.hash(customer.password)
+        self.add_customer(customer)
+        self.registry_changed(customer)
+        customer.accounts_loaded = True # a new customer has no file yet
+        if TransactionJournal.active is not None:
+            TransactionJournal.active.record_customer(customer)
+
+    # single pass over a customer file, yielding (account_details, transactions) for every account block
+    # transactions are (seconds since 1970-01-01, type, amount) tuples
+    @staticmethod
+    def parse_account_details(lines):
+        account_details = {}
+        transactions = None
+        for line in lines:
+            line = line.strip()
+            if transactions is not None: # inside a transaction history block
+                if line == "":
+                    yield account_details, transactions
+                    account_details, transactions = {}, None
+                    continue
+                transaction_parts = line.split(" - ", 1)
+                if len(transaction_parts) == 2:
+                    timestamp = TimestampCodec.parse(transaction_parts[0])
+                    transaction_type, amount = transaction_parts[1].rsplit(": ", 1)
+                    transactions.append((timestamp, transaction_type, float(amount)))
+                    continue
+                # a header line without blank separator starts the next account
+                yield account_details, transactions
+                account_details, transactions = {}, None
+            if line.startswith("Account Type:"):
+                account_details["account_type"] = line.split(": ")[1]
+            elif line.startswith("Account Number:"):
+                account_details["account_number"] = line.split(": ")[1]
+            elif line.startswith("Balance:"):
+                account_details["balance"] = float(line.split(": ")[1])
+            elif line.split(": ", 1)[0] in BankingSystem.LOAN_TERMS:
+                BankingSystem.parse_loan_term(account_details, line)
+            elif line.startswith("Transaction History:"):
+                transactions = []
+        if transactions is not None:
+            yield account_details, transactions
+
+    # the same pass as parse_account_details over a file opened in binary mode, but transactions are only checked
+    # and counted, a line that does not parse raises ValueError here rather than when the history is first used
+    # yields (account_details, offset, count) with the byte offset of the account's first transaction line
+    @staticmethod
+    def scan_account_details(file):
+        account_details = {}
+        offset = count = None
+        position = 0
+        parse_line = LedgerFile.parse_line
+        for line in file:
+            position += len(line)
+            if count is not None: # inside a transaction history block
+                if line.isspace():
+                    yield account_details, offset, count
+                    account_details, offset, count = {}, None, None
+                    continue
+                if b" - " in line.strip():
+                    if parse_line(line)[1] == "Loan Installment":
+                        account_details["installments"] = account_details.get("installments", 0) + 1
+                    count += 1
+                    continue
+                # a header line without blank separator starts the next account
+                yield account_details, offset, count
+                account_details, offset, count = {}, None, None
+            line = line.decode("utf-8").strip()
+            if line.startswith("Account Type:"):
+                account_details["account_type"] = line.split(": ")[1]
+            elif line.startswith("Account Number:"):
+                account_details["account_number"] = line.split(": ")[1]
+            elif line.startswith("Balance:"):
+                account_details["balance"] = float(line.split(": ")[1])
+            elif line.split(": ", 1)[0] in BankingSystem.LOAN_TERMS:
+                BankingSystem.parse_loan_term(account_details, line)
+            elif line.startswith("Transaction History:"):
+                offset, count = position, 0
+        if count is not None:
+            yield account_details, offset, count
+
+    # the lines after a loan's balance holding its terms, and the account_details key and type of each
+    LOAN_TERMS = {"Principal Amount": ("principal_amount", float), "Interest Rate": ("interest_rate", float),
+                  "Loan Duration": ("loan_duration", int), "Installments Paid": ("installments_paid", int)}
+
+    @staticmethod
+    def parse_loan_term(account_details, line):
+        label, value = line.split(": ", 1)
+        key, parse = BankingSystem.LOAN_TERMS[label]
+        account_details[key] = parse(value)
+
+    # building an account object from the details read from file
+    @staticmethod
+    def build_account(account_details):
+        account_type = account_details.get("account_type")
+        account_number = account_details.get("account_number")
+        balance = account_details.get("balance")
+
+        if account_type == "CheckingAccount":
+            return CheckingAccount(account_number, balance)
+        elif account_type == "SavingAccount":
+            return SavingAccount(account_number, balance)
+        elif account_type == "LoanAccount":
+            return BankingSystem.build_loan_account(account_details)
+        else:
+            raise ValueError("Invalid account type.")
+
+    # files saved before loan terms were kept hold only a loan's balance, they are converted on load:
+    # - a balance above 0 is the principal still owed, spread over the installments left at the default terms
+    #   of LoanAccount, one installment counted as paid for each "Loan Installment" row of the history
+    # - the first version of the banking system started a loan's balance at 0 and took each installment off it,
+    #   so a balance of 0 or below is minus the principal repaid and the principal itself was never saved,
+    #   such a file fails to load until a "Principal Amount:" line with the amount lent is added after the
+    #   balance, the loan then continues at the default terms with the principal owed reduced by the repayments
+    @staticmethod
+    def build_loan_account(account_details):
+        account_number = account_details.get("account_number")
+        balance = account_details.get("balance")
+        if "installments_paid" in account_details:
+            account = LoanAccount(account_number, account_details.get("principal_amount"),
+                                  account_details.get("interest_rate"), account_details.get("loan_duration"))
+            account.installments_paid = account_details["installments_paid"]
+            account.balance = Money.of(balance)
+        else:
+            installments_paid = account_details.get("installments", 0)
+            if balance > 0: # 12 installments is the default duration
+                return LoanAccount(account_number, balance, loan_duration=max(12 - installments_paid, 1))
+            if "principal_amount" not in account_details:
+                raise ValueError(f"Loan account {account_number} was saved without its principal amount, "
+                                 f"add a \"Principal Amount:\" line after its balance.")
+            account = LoanAccount(account_number, account_details["principal_amount"])
+            account.installments_paid = installments_paid
+            account.balance = account.principal_amount + Money.of(balance)
+        account.min_balance_cents = account.max_balance_cents = account.balance_cents
+        return account
+
     #loading each customer's account details and transaction history from file
     @staticmethod
     def load_account_details_from_file(customer):
-        filename = f"{customer.username}.txt"  # Unique file based on username
+        if customer.accounts_loaded: # accounts already in memory are newer than the file
+            return
+        filename = ledger_filename(customer.username)  # Unique file based on username
+        if customer.snapshot:
+            snapshot, offset = customer.snapshot
+            # a text file saved after the snapshot was taken holds newer data
+            if not (os.path.exists(filename) and os.path.getmtime(filename) > snapshot.mtime):
+                for account in snapshot.load_accounts(offset):
+                    customer.load_account(account)
+                customer.accounts_loaded = True
+                return
+        accounts = []
         try:
-            with open(filename, 'r') as file:
-                lines = file.readlines()
-
-            account_details = {}
-            current_account = None
-
-            for line in lines:
-                if line.startswith("Account Type:"):
-                    account_type = line.strip().split(": ")[1]
-                    account_details["account_type"] = account_type
-                elif line.startswith("Account Number:"):
-                    account_details["account_number"] = line.strip().split(": ")[1]
-                elif line.startswith("Balance:"):
-                    account_details["balance"] = float(line.strip().split(": ")[1])
-                elif line.startswith("Transaction History:"):
-                    if current_account:
-                        customer.accounts.append(current_account)
-
-                    account_type = account_details.get("account_type")
-                    account_number = account_details.get("account_number")
-                    balance = account_details.get("balance")
-
-                    if account_type == "CheckingAccount":
-                        current_account = CheckingAccount(account_number, balance)
-                    elif account_type == "SavingAccount":
-                        current_account = SavingAccount(account_number, balance)
-                    elif account_type == "LoanAccount":
-                        current_account = LoanAccount(account_number, balance, 0)  # Set initial balance to 0
-                    else:
-                        raise ValueError("Invalid account type.")
+            with open(filename, 'rb') as file:
+                stat = os.fstat(file.fileno())
+                if Metrics.active is not None:
+                    Metrics.active.record_io("read", stat.st_size)
+                # the file is streamed once, transactions are left in it until an account's history is used
+                ledger = LedgerFile(filename, stat)
+                for account_details, offset, count in BankingSystem.scan_account_details(file):
+                    account = BankingSystem.build_account(account_details)
+                    if count:
+                        account.transaction_history = TransactionHistory((ledger, offset, count))
+                    account.type_counts = account.type_sums = None # rebuilt from the history if asked for
+                    accounts.append(account)
+        except FileNotFoundError: # a customer without a file has no accounts yet
+            pass
+        # a file that cannot be read leaves the customer unloaded, so that no save overwrites the file
+        try:
+            for account in accounts:
+                customer.load_account(account)
+            BankingSystem.replay_transaction_log(customer)
+        except (ValueError, IOError):
+            for account in accounts:
+                customer.remove_account(account)
+            raise
+        for account in customer.accounts:
+            account.mark_saved()
+        customer.accounts_loaded = True
+
+    #loading the files of every customer not loaded yet, so that every account is in the index
+    #returns a list of (username, error) for files that could not be loaded, those customers stay unloaded
+    def load_all_account_details(self):
+        errors = []
+        for customer in self.customers:
+            try:
+                self.load_account_details_from_file(customer)
+            except (ValueError, IOError) as e:
+                errors.append((customer.username, str(e)))
+        return errors
+
+    #bank wide statistics, rolled up from each account's running statistics without reading transactions
+    def get_statistics(self):
+        self.load_all_account_details()
+        counts, sums, accounts_by_type = {}, {}, {}
+        total_balance = 0
+        min_balance = max_balance = None
+        for customer in self.customers:
+            for account in customer.accounts:
+                statistics = account.get_statistics()
+                for transaction_type, count in statistics["counts"].items():
+                    counts[transaction_type] = counts.get(transaction_type, 0) + count
+                for transaction_type, cents in account.type_sums.items():
+                    sums[transaction_type] = sums.get(transaction_type, 0) + cents
+                account_type = type(account).__name__
+                accounts_by_type[account_type] = accounts_by_type.get(account_type, 0) + 1
+                total_balance += account.balance
+                min_balance = statistics["min_balance"] if min_balance is None else min(min_balance, statistics["min_balance"])
+                max_balance = statistics["max_balance"] if max_balance is None else max(max_balance, statistics["max_balance"])
+        return {
+            "customers": len(self.customers),
+            "accounts": accounts_by_type,
+            "transactions": sum(counts.values()),
+            "counts": counts,
+            "sums": {transaction_type: cents / 100 for transaction_type, cents in sums.items()},
+            "deposits": sums.get("Deposit", 0) / 100,
+            "withdrawals": (sums.get("Withdrawal", 0) + sums.get("Withdrawal (Overdraft)", 0)) / 100,
+            "overdrafts": counts.get("Withdrawal (Overdraft)", 0),
+            "interest_earned": sums.get("Interest Credit", 0) / 100,
+            "total_balance": total_balance,
+            "min_balance": min_balance,
+            "max_balance": max_balance,
+            "duplicate_account_numbers": len(self.duplicate_account_numbers),
+        }
 
-                    #calling load_transaction_history method from account class
-                    current_account.load_transaction_history_from_file(lines)
+    #loading every customer file not loaded yet across a pool of processes
+    #returns a list of (username, error) for files that could not be loaded, the other files are still loaded
+    def load_all_account_details_parallel(self, workers=None, chunk_size=64):
+        from concurrent.futures import ProcessPoolExecutor # imported here, it is slow to import
+        customers = [customer for customer in self.customers if not customer.accounts_loaded]
+        snapshot_customers = [customer for customer in customers if customer.snapshot]
+        for customer in snapshot_customers: # accounts in a mapped snapshot are cheaper to read here
+            self.load_account_details_from_file(customer)
+        customers = [customer for customer in customers if not customer.snapshot]
+        chunks = [[customer.username for customer in customers[i:i + chunk_size]]
+                  for i in range(0, len(customers), chunk_size)]
+        errors = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=use_storage,
+                                 initargs=(ShardedStorage.active,)) as executor:
+            # results come back in submission order, so accounts are added in the same order as a serial load
+            for chunk, results in zip(chunks, executor.map(load_account_details_chunk, chunks)):
+                for username, accounts, error in results:
+                    if error: # the customer stays unloaded, so that no save overwrites the file
+                        errors.append((username, error))
+                        continue
+                    customer = self.get_customer_by_username(username)
+                    for account in accounts:
+                        customer.load_account(account)
+                    customer.accounts_loaded = True
+        return errors
+
+    #saving the file of every loaded customer across a pool of processes
+    #returns a list of (username, error) for files that could not be written, the other files are still written
+    def save_all_account_details_parallel(self, workers=None, chunk_size=64):
+        from concurrent.futures import ProcessPoolExecutor # imported here, it is slow to import
+        customers = [customer for customer in self.customers if customer.accounts_loaded]
+        chunks = [[(customer.username, customer.first_name, customer.last_name, customer.accounts)
+                   for customer in customers[i:i + chunk_size]]
+                  for i in range(0, len(customers), chunk_size)]
+        errors = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=use_storage,
+                                 initargs=(ShardedStorage.active,)) as executor:
+            for chunk, results in zip(chunks, executor.map(save_account_details_chunk, chunks)):
+                for (username, first_name, last_name, accounts), error in zip(chunk, results):
+                    if error:
+                        errors.append((username, error))
+                    else: # the worker marked its own copies as saved
+                        for account in accounts:
+                            account.mark_saved()
+        return errors
+
+    #month end: crediting interest to every savings account and taking an installment from every loan account
+    def process_month_end(self, timestamp=None):
+        self.load_all_account_details()
+        timestamp = timestamp or datetime.datetime.now()
+        saving_accounts, loan_accounts = [], []
+        for customer in self.customers:
+            for account in customer.accounts:
+                if isinstance(account, SavingAccount):
+                    saving_accounts.append(account)
+                elif isinstance(account, LoanAccount):
+                    loan_accounts.append(account)
+        SavingAccount.credit_interest_batch(saving_accounts, timestamp)
+        LoanAccount.pay_installment_batch(loan_accounts, timestamp)
+        return len(saving_accounts), len(loan_accounts)
+
+    # applying a CSV or JSON lines file of (account_number, op, amount) records without any prompts
+    # op is deposit or withdraw, withdrawals go through the same balance and credit limit checks as the menu
+    # returns the number of applied records and a list of (record number, record, reason) rejections
+    def process_transaction_file(self, filename, quiet=True):
+        self.load_all_account_details()
+        with open(filename, 'r', newline='') as file:
+            if filename.endswith((".jsonl", ".json")):
+                records = BankingSystem.read_json_transactions(file)
+            else:
+                records = BankingSystem.read_csv_transactions(file)
+            return self.process_transactions(records, quiet)
 
-            # Add the last account if it exists
-            if current_account:
-                customer.accounts.append(current_account)
+    @staticmethod
+    def read_csv_transactions(file):
+        for record in csv.reader(file):
+            if not record or record[0] == "account_number": # blank line or header
+                continue
+            yield record
 
-        except IOError:
-            pass
+    @staticmethod
+    def read_json_transactions(file):
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                yield [record.get("account_number"), record.get("op"), record.get("amount")]
+            except (ValueError, AttributeError):
+                yield [line.strip()]
+
+    def process_transactions(self, records, quiet=True):
+        applied = 0
+        rejections = []
+        accounts_by_number = self.accounts_by_number
+        for record_number, record in enumerate(records, 1):
+            if len(record) != 3:
+                rejections.append((record_number, record, "Malformed record."))
+                continue
+            account_number, op, amount = record
+            found = accounts_by_number.get(str(account_number))
+            if found is None:
+                rejections.append((record_number, record, "Account not found."))
+                continue
+            account = found[1]
+            try:
+                amount = float(amount)
+            except (TypeError, ValueError):
+                rejections.append((record_number, record, "Invalid amount."))
+                continue
+            if not 0 < amount < float("inf"): # also rejects nan
+                rejections.append((record_number, record, "Amount must be positive."))
+                continue
+            try:
+                cents = Money.cents_of(amount)
+            except ValueError as e: # beyond MAX_CENTS
+                rejections.append((record_number, record, str(e)))
+                continue
+            if cents == 0: # rounds to nothing, posting it would record a transaction of 0.0
+                rejections.append((record_number, record, "Amount must be at least one cent."))
+                continue
+            if isinstance(account, LoanAccount):
+                rejections.append((record_number, record, "Deposits and withdrawals are not allowed on Loan accounts."))
+                continue
+            op = op.lower() if isinstance(op, str) else op
+            try:
+                if op == "deposit":
+                    account.deposit(Money(cents), quiet)
+                elif op in ("withdraw", "withdrawal"):
+                    account.withdraw(Money(cents), quiet)
+                else:
+                    rejections.append((record_number, record, "Invalid operation."))
+                    continue
+            except ValueError as e: # insufficient balance
+                rejections.append((record_number, record, str(e)))
+                continue
+            applied += 1
+        return applied, rejections
+
+    #starting the bank from a snapshot instead of the text files
+    def load_snapshot(self, filename):
+        self.customers = BankSnapshot(filename).load_customers()
+
+    #writing the whole bank, including accounts of customers who did not log in, to a snapshot
+    def save_snapshot(self, filename):
+        errors = self.load_all_account_details()
+        if errors: # those customers would be in the snapshot without accounts
+            raise ValueError(f"Snapshot not saved, {len(errors)} customer files could not be loaded, "
+                             f"first {errors[0][0]}: {errors[0][1]}")
+        BankSnapshot.save(self.customers, filename)
+
+    #converting customers.txt and the customer files into a snapshot
+    @staticmethod
+    def export_snapshot(customers_filename, snapshot_filename):
+        banking_system = BankingSystem()
+        banking_system.customers = BankingSystem.load_customers_from_file(customers_filename)
+        banking_system.save_snapshot(snapshot_filename)
+
+    #converting a snapshot back into customers.txt and the customer files
+    @staticmethod
+    def import_snapshot(snapshot_filename, customers_filename):
+        banking_system = BankingSystem()
+        banking_system.load_snapshot(snapshot_filename)
+        banking_system.load_all_account_details()
+        BankingSystem.save_customers_to_file(banking_system.customers, customers_filename)
+        BankingSystem.save_account_details_to_file(banking_system.customers, "customer_files")
 
     # viewing cutomers detail
     def view_customer_details(self, username):
@@ -332,14 +2400,26 @@ class BankingSystem:
     def register_customer(self):
         print("\n--- Register Customer ---")
         username = input("Enter username: ")
+        if self.get_customer_by_username(username):
+            print("Username already exists.")
+            return
         password = input("Enter password: ")
         first_name = input("Enter first name: ")
         last_name = input("Enter last name: ")
         address = input("Enter address: ")
 
         customer = Customer(username, password, first_name, last_name, address)
+        self.add_new_customer(customer)
         print("Customer registered successfully!")
-        self.customers.append(customer)
+
+# admin username and password hash
+ADMIN_CREDENTIALS = ("neduet", "scrypt$16384$8$1$5c4f37f572e5cb95e46b43d5eb77118b$"
+                               "304877c4aa1553c2084f87b6b646b8fcd24b6140aac8bc03ed87058e25e25ba6")
+
+
+def check_admin_credentials(username, password):
+    return username == ADMIN_CREDENTIALS[0] and PasswordHasher.active.verify(password, ADMIN_CREDENTIALS[1])
+
 
 class BankingSystemCLI:
     def __init__(self, banking_system):
@@ -374,9 +2454,13 @@ class BankingSystemCLI:
         password = input("Enter your password: ")
 
         customer = self.banking_system.get_customer_by_username(username)
-        if customer and customer.username == username and customer.password == password:#checking is customer input correct credentials
+        if customer and customer.check_password(password):#checking is customer input correct credentials
             # Load the account details for the logged-in customer
-            self.banking_system.load_account_details_from_file(customer)
+            try:
+                self.banking_system.load_account_details_from_file(customer)
+            except (ValueError, IOError) as e: # the file is left as it is
+                print(f"Your account details could not be loaded: {e}")
+                return
             print(f"Welcome, {customer.first_name} {customer.last_name}!")
 
             while True:
@@ -400,8 +2484,8 @@ class BankingSystemCLI:
                 elif choice == "5":
                     self.view_customer_details(customer)
                 elif choice == "6":
-                    # Save account details to separate files in the "customer_files" directory
-                    banking_system.save_account_details_to_file(banking_system.customers, "customer_files")
+                    # Save changed account details to separate files in the "customer_files" directory
+                    self.banking_system.checkpoint()
                     break
                 else:
                     print("Invalid choice. Try again.")
@@ -435,7 +2519,10 @@ class BankingSystemCLI:
                 kwargs = {"principal_amount": principal_amount, "interest_rate": interest_rate, "loan_duration": loan_duration}
 
             # calling create account method from customer class
-            customer.create_account(account_type, account_number, **kwargs)
+            try:
+                customer.create_account(account_type, account_number, **kwargs)
+            except ValueError as e: # account number already taken
+                print(str(e))
 
         else:
             print("Invalid account type.")
@@ -494,14 +2581,16 @@ class BankingSystemCLI:
         password = input("Enter your password: ")
 
         # Perform admin authentication (e.g., check against admin credentials)
-        if username == "neduet" and password == "cisd": # checking is admin credentials are correct or not
+        if check_admin_credentials(username, password): # checking is admin credentials are correct or not
             print("Admin login successful!")
 
             while True:
                 print("\n--- Admin Menu ---")
                 print("1. Register Customer")
                 print("2. View Customer Details")
-                print("3. Quit")
+                print("3. Find Account")
+                print("4. View Metrics")
+                print("5. Quit")
 
                 choice = input("Enter your choice: ")
                 if choice == "1":
@@ -509,16 +2598,55 @@ class BankingSystemCLI:
                 elif choice == "2":
                     username = input("Enter the customer username: ")
                     customer = self.banking_system.get_customer_by_username(username)
-                    if customer:
-                        self.banking_system.load_account_details_from_file(customer)
-                    self.banking_system.view_customer_details(username)
+                    try:
+                        if customer:
+                            self.banking_system.load_account_details_from_file(customer)
+                        self.banking_system.view_customer_details(username)
+                    except (ValueError, IOError) as e:
+                        print(f"Account details could not be loaded: {e}")
                 elif choice == "3":
+                    self.find_account()
+                elif choice == "4":
+                    self.view_metrics()
+                elif choice == "5":
                     break
                 else:
                     print("Invalid choice. Try again.")
 
         else:
             print("Invalid admin credentials. Try again.")
+    # showing the metrics collected so far, and optionally writing them to a file
+    def view_metrics(self):
+        print("\n--- Metrics ---")
+        if Metrics.active is None:
+            print("Metrics are not enabled, start the program with --metrics.")
+            return
+        print(Metrics.active.report())
+        export = input("Export as json or prometheus (Enter to skip): ").strip().lower()
+        if export == "json":
+            with open("metrics.json", 'w') as file:
+                file.write(Metrics.active.to_json())
+            print("Metrics written to metrics.json")
+        elif export == "prometheus":
+            with open("metrics.prom", 'w') as file:
+                file.write(Metrics.active.to_prometheus())
+            print("Metrics written to metrics.prom")
+
+    # finding an account and its owner from the account number only
+    def find_account(self):
+        print("\n--- Find Account ---")
+        account_number = input("Enter the account number: ")
+        result = self.banking_system.get_account_by_number(account_number)
+        if result is None: # account may belong to a customer whose file is not loaded yet
+            self.banking_system.load_all_account_details()
+            result = self.banking_system.get_account_by_number(account_number)
+        if result:
+            customer, account = result
+            print(f"{account} belongs to {customer} (username: {customer.username})")
+            print(f"Balance: {account.balance_enquiry()}")
+        else:
+            print("Account not found.")
+
     #calling registe_customer method from customer class
     def register_customer(self):
         self.banking_system.register_customer()
@@ -526,24 +2654,429 @@ class BankingSystemCLI:
 
 
 
-# Create an instance of the BankingSystem
-banking_system = BankingSystem()
-
-# Load customers from a file
-customers = banking_system.load_customers_from_file("customers.txt")
-banking_system.customers = customers
+# network front end serving the customer and admin menus to many sessions at once over asyncio
+# protocol: one JSON object per line in each direction, requests carry an "op" field and every reply has "ok"
+# customer ops: login, create_account, deposit, withdraw, balance, details, logout
+# admin ops: admin_login, register, details (with username), find_account, logout
+class BankingSystemServer:
+    def __init__(self, banking_system, checkpoint_interval=60.0):
+        self.banking_system = banking_system
+        # username -> asyncio.Lock, held while the customer's accounts change and while its file is read or written
+        self.locks = {}
+        self.session_tasks = set() # sessions being served, closed before the server stops
+        self.io_pool = None # one thread for file work, so that loads and saves never overlap each other
+        self.checkpoint_interval = checkpoint_interval
+
+    # running file work on the I/O thread, the event loop keeps serving other sessions meanwhile
+    def run_io(self, function, *args):
+        import asyncio
+        if self.io_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.io_pool = ThreadPoolExecutor(1, thread_name_prefix="bank-io")
+        return asyncio.get_running_loop().run_in_executor(self.io_pool, function, *args)
+
+    def lock_for(self, key):
+        import asyncio
+        lock = self.locks.get(key)
+        if lock is None:
+            lock = self.locks[key] = asyncio.Lock()
+        return lock
+
+    # serving on a TCP host and port, or on a Unix socket when path is given, until cancelled
+    async def serve(self, host="127.0.0.1", port=8765, path=None):
+        import asyncio
+        if path:
+            server = await asyncio.start_unix_server(self.handle_session, path, limit=1 << 20, backlog=4096)
+        else:
+            server = await asyncio.start_server(self.handle_session, host, port, limit=1 << 20, backlog=4096)
+        checkpoints = asyncio.create_task(self.checkpoint_periodically())
+        try:
+            async with server:
+                try:
+                    await server.serve_forever()
+                finally:
+                    checkpoints.cancel()
+                    await self.close_sessions()
+        finally:
+            try:
+                await checkpoints
+            except asyncio.CancelledError:
+                pass
+            # the last checkpoint saves through the I/O thread and the customer locks like any other, after any save
+            # a cancelled checkpoint left running there, then the thread is shut down
+            await self.checkpoint()
+            await self.run_io(self.banking_system.save_registry)
+            self.io_pool.shutdown()
+            self.io_pool = None
+
+    # closing every open session, each logs out and saves its customer as on a logout request
+    async def close_sessions(self):
+        import asyncio
+        sessions = list(self.session_tasks)
+        for task in sessions:
+            task.cancel()
+        await asyncio.gather(*sessions, return_exceptions=True)
+
+    async def handle_session(self, reader, writer):
+        import asyncio
+        session = {"customer": None, "admin": False}
+        task = asyncio.current_task()
+        self.session_tasks.add(task)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = None
+                try:
+                    request = json.loads(line)
+                    reply = await self.handle_request(session, request)
+                except ValueError as e: # bad JSON or a refused operation
+                    reply = {"ok": False, "error": str(e)}
+                except (KeyError, TypeError) as e:
+                    reply = {"ok": False, "error": f"Missing or invalid field {e}."}
+                except OSError as e: # an account file that could not be read or written, the session goes on
+                    reply = {"ok": False, "error": str(e)}
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+                if isinstance(request, dict) and request.get("op") == "quit":
+                    break
+        except (ConnectionError, ValueError): # connection lost or a line over the size limit
+            pass
+        finally:
+            try:
+                await self.logout(session)
+            finally:
+                self.session_tasks.discard(task)
+                writer.close()
+
+    async def handle_request(self, session, request):
+        if not isinstance(request, dict):
+            raise ValueError("Request must be a JSON object.")
+        op = request.get("op")
+        customer = session["customer"]
+        if op == "login":
+            return await self.login(session, request)
+        if op == "admin_login":
+            if not await PasswordHasher.active.run_async(check_admin_credentials, request["username"], request["password"]):
+                raise ValueError("Invalid admin credentials.")
+            await self.logout(session)
+            session["admin"] = True
+            return {"ok": True}
+        if op in ("logout", "quit"):
+            await self.logout(session)
+            return {"ok": True}
+        if session["admin"]:
+            if op == "register":
+                reply = await self.register(request)
+                await self.wait_durable()
+                return reply
+            if op == "details":
+                customer = self.banking_system.get_customer_by_username(request["username"])
+                if customer is None:
+                    raise ValueError("Customer not found.")
+                async with self.lock_for(customer.username):
+                    await self.run_io(self.banking_system.load_account_details_from_file, customer)
+                    return await self.run_io(self.details, customer)
+            if op == "metrics":
+                if Metrics.active is None:
+                    raise ValueError("Metrics are not enabled.")
+                if request.get("format") == "prometheus":
+                    return {"ok": True, "metrics": Metrics.active.to_prometheus()}
+                return {"ok": True, "metrics": Metrics.active.snapshot()}
+            if op == "find_account":
+                result = self.banking_system.get_account_by_number(request["account_number"])
+                if result is None: # account may belong to a customer whose file is not loaded yet
+                    await self.run_io(self.banking_system.load_all_account_details)
+                    result = self.banking_system.get_account_by_number(request["account_number"])
+                if result is None:
+                    raise ValueError("Account not found.")
+                owner, account = result
+                return {"ok": True, "username": owner.username, "account_type": type(account).__name__,
+                        "balance": float(account.balance_enquiry())}
+        elif customer is not None:
+            if op == "create_account":
+                return await self.create_account(customer, request)
+            if op == "details":
+                async with self.lock_for(customer.username): # histories may still have to be read from file
+                    return await self.run_io(self.details, customer)
+            if op in ("deposit", "withdraw", "balance"):
+                account = customer.get_account_by_number(request["account_number"])
+                if account is None:
+                    raise ValueError("Account not found.")
+                # waits for a save of the customer's file in progress, which must not see a half made change
+                async with self.lock_for(customer.username):
+                    if op == "balance":
+                        return {"ok": True, "balance": float(account.balance_enquiry())}
+                    if isinstance(account, LoanAccount):
+                        raise ValueError("Deposits and withdrawals are not allowed on Loan accounts.")
+                    amount = float(request["amount"])
+                    if not 0 < amount < float("inf"):
+                        raise ValueError("Amount must be positive.")
+                    amount = Money(Money.cents_of(amount)) # raises ValueError beyond MAX_CENTS
+                    if amount.cents == 0:
+                        raise ValueError("Amount must be at least one cent.")
+                    # a history still in the account file is read on the I/O thread, not by the posting below
+                    await self.run_io(TransactionHistory.load_histories, [account])
+                    if op == "deposit":
+                        account.deposit(amount, quiet=True)
+                    else:
+                        account.withdraw(amount, quiet=True) # overdraft and credit limit checks raise ValueError
+                    balance = float(account.balance_enquiry())
+                await self.wait_durable()
+                return {"ok": True, "balance": balance}
+        else:
+            raise ValueError("Please log in first.")
+        raise ValueError("Invalid operation.")
+
+    # checkpointing every checkpoint_interval seconds while the journal has new lines, so that it stays short
+    # and a restart after a crash has little to replay
+    async def checkpoint_periodically(self):
+        import asyncio
+        checkpointed = 0
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            journal = TransactionJournal.active
+            if journal is not None and journal.appended > checkpointed:
+                checkpointed = await self.checkpoint() or checkpointed
+
+    # saving every change and dropping the journal lines the files now hold, like BankingSystem.checkpoint
+    # each customer is saved on the I/O thread under its lock, lines journaled meanwhile are kept
+    # returns the sequence number the journal was truncated to, None if a file could not be read or written
+    async def checkpoint(self):
+        journal = TransactionJournal.active
+        sequence = journal.appended if journal is not None else 0
+        registered = journal is not None and journal.customers_registered
+        try:
+            for customer in await self.run_io(self.changed_customers):
+                async with self.lock_for(customer.username):
+                    await self.run_io(BankingSystem.save_changed_customer, customer)
+            if registered:
+                await self.run_io(self.banking_system.write_registry)
+            if journal is not None:
+                await self.run_io(journal.truncate, sequence)
+        except (ValueError, IOError):
+            return None
+        return sequence
+
+    def changed_customers(self):
+        return [customer for customer in self.banking_system.customers
+                if customer.accounts_loaded and any(account.dirty for account in customer.accounts)]
+
+    # replying only once the change is in the journal on disk, when journaling is on
+    async def wait_durable(self):
+        if TransactionJournal.active is not None:
+            await TransactionJournal.active.wait_async()
+
+    async def login(self, session, request):
+        await self.logout(session)
+        customer = self.banking_system.get_customer_by_username(request["username"])
+        if customer is None or not await PasswordHasher.active.run_async(customer.check_password, request["password"]):
+            raise ValueError("Invalid username or password.")
+        async with self.lock_for(customer.username):
+            await self.run_io(self.banking_system.load_account_details_from_file, customer)
+        session["customer"] = customer
+        return {"ok": True, "name": f"{customer.first_name} {customer.last_name}"}
+
+    # like the Logout menu entry, saving what this customer changed
+    async def logout(self, session):
+        customer, session["customer"], session["admin"] = session["customer"], None, False
+        if customer is not None:
+            async with self.lock_for(customer.username):
+                await self.run_io(self.banking_system.save_changed_account_details, [customer], "customer_files")
+
+    async def register(self, request):
+        fields = [request["username"], request["password"], request["first_name"], request["last_name"], request["address"]]
+        if not all(isinstance(field, str) for field in fields):
+            raise ValueError("Customer fields must be strings.")
+        if self.banking_system.get_customer_by_username(fields[0]) is not None:
+            raise ValueError("Username already exists.")
+        fields[1] = await PasswordHasher.active.run_async(PasswordHasher.active.hash, fields[1])
+        self.banking_system.add_new_customer(Customer(*fields)) # duplicate usernames raise ValueError
+        return {"ok": True}
+
+    async def create_account(self, customer, request):
+        account_type = request["account_type"]
+        kwargs = {
+            "Checking": ("balance", "credit_limit", "overdraft_fee"),
+            "Savings": ("balance", "interest_rate"),
+            "Loan": ("principal_amount", "interest_rate", "loan_duration"),
+        }.get(account_type)
+        if kwargs is None:
+            raise ValueError("Invalid account type.")
+        kwargs = {name: float(request[name]) for name in kwargs if name in request}
+        if "loan_duration" in kwargs:
+            kwargs["loan_duration"] = int(kwargs["loan_duration"])
+        # every customer file is read on the I/O thread first, so the number check below does no file work
+        await self.run_io(self.banking_system.load_account_index)
+        async with self.lock_for(customer.username):
+            customer.create_account(account_type, str(request["account_number"]), quiet=True, **kwargs)
+        await self.wait_durable()
+        return {"ok": True}
 
-# Register a customer
-# banking_system.register_customer()
+    @staticmethod
+    def details(customer):
+        accounts = []
+        for account in customer.accounts:
+            transactions = [list(transaction) for transaction in account.get_transaction_history().formatted_rows()]
+            accounts.append({"account_type": type(account).__name__, "account_number": account.account_number,
+                             "balance": float(account.balance_enquiry()), "transactions": transactions})
+        return {"ok": True, "username": customer.username, "name": f"{customer.first_name} {customer.last_name}",
+                "address": customer.address, "accounts": accounts}
+
+
+Metrics.TIMED = [
+    (CheckingAccount, "deposit", "deposit"),
+    (CheckingAccount, "withdraw", "withdraw"),
+    (SavingAccount, "deposit", "deposit"),
+    (SavingAccount, "withdraw", "withdraw"),
+    (Customer, "check_password", "login"),
+    (BankingSystem, "load_customers_from_file", "load_customers"),
+    (BankingSystem, "write_customers_file", "save_customers"),
+    (BankingSystem, "load_account_details_from_file", "load"),
+    (BankingSystem, "save_customer_account_details", "save"),
+    (BankingSystem, "append_transaction_log", "append_log"),
+    (BankingSystem, "save_account_details_to_file", "save_all"),
+    (BankingSystem, "checkpoint", "checkpoint"),
+]
+
+
+# process pool workers for BankingSystem.load_all_account_details_parallel and save_all_account_details_parallel
+# a failing file is reported back instead of stopping the rest of the chunk
+def load_account_details_chunk(usernames):
+    results = []
+    for username in usernames:
+        customer = Customer(username, "", "", "", "")
+        try:
+            BankingSystem.load_account_details_from_file(customer)
+            for account in customer.accounts: # histories are sent back read, a bad line is reported here
+                history = account.get_transaction_history()
+                if history.pending:
+                    history.load_pending()
+            results.append((username, customer.accounts, None))
+        except Exception as e:
+            results.append((username, None, f"{type(e).__name__}: {e}"))
+    return results
+
+
+def save_account_details_chunk(records):
+    results = []
+    for username, first_name, last_name, accounts in records:
+        customer = Customer(username, "", first_name, last_name, "")
+        customer.accounts = accounts
+        try:
+            BankingSystem.save_customer_account_details(customer)
+            results.append(None)
+        except Exception as e:
+            results.append(f"{type(e).__name__}: {e}")
+    return results
+
+
+# entry point of the program, the module itself only defines the classes and can be imported freely
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    # Profile the whole session: --profile writes bank.prof and prints the most expensive calls on exit
+    if "--profile" in argv:
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(main, [arg for arg in argv if arg != "--profile"])
+        finally:
+            profiler.dump_stats("bank.prof")
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(30)
+
+    # Collect operation latencies and I/O totals: --metrics, viewable from the admin menu
+    if "--metrics" in argv:
+        argv = [arg for arg in argv if arg != "--metrics"]
+        Metrics.enable()
+
+    # Create an instance of the BankingSystem, customers are loaded from customers.txt when first needed
+    banking_system = BankingSystem("customers.txt")
+
+    # A bank migrated with --migrate-storage keeps its registry and account files sharded under customer_files
+    if ShardedStorage.exists("customer_files"):
+        banking_system.open_storage("customer_files")
+    # Otherwise a snapshot written by --export-snapshot is started from while it is newer than customers.txt,
+    # account files saved after it are still read from text
+    elif os.path.exists("bank.snapshot") and (not os.path.exists("customers.txt")
+                                              or os.path.getmtime("bank.snapshot") > os.path.getmtime("customers.txt")):
+        banking_system.load_snapshot("bank.snapshot")
+
+    # Replay transactions a crashed run left in the journal, then journal every new one
+    journal = banking_system.open_journal("bank.journal")
+    try:
+        # Move customers.txt and the account files into a sharded storage: --migrate-storage [SHARDS]
+        if argv and argv[0] == "--migrate-storage" and len(argv) <= 2:
+            if banking_system.storage is not None:
+                print("customer_files already holds a sharded storage.")
+                return 1
+            if not os.path.exists("customers.txt"):
+                print("customers.txt not found.")
+                return 1
+            shards = int(argv[1]) if len(argv) == 2 else 256
+            count = ShardedStorage.migrate("customers.txt", "customer_files", shards)
+            print(f"{count} customers moved to customer_files in {shards} shards.")
+            return 0
+
+        # Convert the text files into a snapshot or back: --export-snapshot [FILE] or --import-snapshot [FILE]
+        if argv and argv[0] in ("--export-snapshot", "--import-snapshot") and len(argv) <= 2:
+            if banking_system.storage is not None:
+                print("Snapshots are not used with a sharded storage.")
+                return 1
+            filename = argv[1] if len(argv) == 2 else "bank.snapshot"
+            if argv[0] == "--export-snapshot":
+                try:
+                    banking_system.save_snapshot(filename)
+                except ValueError as e: # a customer file that could not be loaded
+                    print(str(e))
+                    return 1
+                print(f"{len(banking_system.customers)} customers written to {filename}.")
+            else:
+                BankingSystem.import_snapshot(filename, "customers.txt")
+                print(f"customers.txt and the account files written from {filename}.")
+            return 0
+
+        # Apply a transaction file without the menus: python bank_system_code.py --batch <file.csv|file.jsonl>
+        if len(argv) == 2 and argv[0] == "--batch":
+            applied, rejections = banking_system.process_transaction_file(argv[1])
+            for record_number, record, reason in rejections:
+                print(f"Record {record_number} rejected ({','.join(map(str, record))}): {reason}")
+            print(f"{applied} transactions applied, {len(rejections)} rejected.")
+            banking_system.checkpoint()
+            if Metrics.active is not None:
+                print(Metrics.active.report())
+            return 0
+
+        # Serve the menus over the network: --serve HOST:PORT or --serve-unix PATH
+        if len(argv) == 2 and argv[0] in ("--serve", "--serve-unix"):
+            import asyncio
+            server = BankingSystemServer(banking_system)
+            if argv[0] == "--serve-unix":
+                serving = server.serve(path=argv[1])
+            else:
+                host, port = argv[1].rsplit(":", 1)
+                serving = server.serve(host, int(port))
+            try:
+                asyncio.run(serving)
+            except KeyboardInterrupt:
+                pass
+            return 0
 
-# Create an instance of the BankingSystemCLI
-cli = BankingSystemCLI(banking_system)
+        # Create an instance of the BankingSystemCLI
+        cli = BankingSystemCLI(banking_system)
 
-# Run the CLI
-cli.run()
+        # Run the CLI
+        cli.run()
 
-# Save customers to a file
-banking_system.save_customers_to_file(banking_system.customers, "customers.txt")
-# Save account details to a file
+        # Save customers to a file
+        banking_system.save_registry()
+        banking_system.checkpoint()
+        return 0
+    finally:
+        journal.close()
 
 
+if __name__ == "__main__":
+    sys.exit(main())
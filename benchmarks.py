@@ -0,0 +1,1130 @@
+import asyncio
+import datetime
+import gc
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from functools import lru_cache
+
+import bank_system_code
+from bank_system_code import (BankingSystem, CheckingAccount, Customer, LoanAccount, Money, PasswordHasher, SavingAccount,
+                              ShardedStorage, TimestampCodec)
+
+
+# one hash of "password" shared by every generated customer, hashing each one would dominate the set up
+@lru_cache(maxsize=None)
+def password_hash():
+    return PasswordHasher.active.hash("password")
+
+
+# writing a customer file in the same format as save_account_details_to_file
+def write_customer_file(username, num_accounts, history_length):
+    account_types = ["CheckingAccount", "SavingAccount", "LoanAccount"]
+    start = datetime.datetime(2024, 1, 1)
+    with open(f"{username}.txt", 'w') as file:
+        file.write("Customer: Bench Customer\n")
+        for i in range(num_accounts):
+            file.write(f"Account Type: {account_types[i % 3]}\n")
+            file.write(f"Account Number: {username}-{i}\n")
+            file.write("Balance: 1000.0\n")
+            file.write("Transaction History:\n")
+            for j in range(history_length):
+                timestamp = (start + datetime.timedelta(seconds=j)).strftime("%Y-%m-%d %H:%M:%S")
+                file.write(f"{timestamp} - Deposit: {float(j)}\n")
+            file.write("\n")
+
+
+# timing load_account_details_from_file while growing the number of accounts and the history length
+def bench_load_account_details(account_counts=(1, 10, 50), history_lengths=(100, 1000, 10000), repeat=3):
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            for num_accounts in account_counts:
+                for history_length in history_lengths:
+                    username = f"bench_{num_accounts}_{history_length}"
+                    write_customer_file(username, num_accounts, history_length)
+                    best = float("inf")
+                    for _ in range(repeat):
+                        customer = Customer(username, "password", "Bench", "Customer", "Address")
+                        start = time.perf_counter()
+                        BankingSystem.load_account_details_from_file(customer)
+                        best = min(best, time.perf_counter() - start)
+                    lines = num_accounts * (history_length + 5)
+                    results.append((num_accounts, history_length, lines, best))
+        finally:
+            os.chdir(cwd)
+
+    print(f"{'accounts':>8} {'history':>8} {'lines':>9} {'seconds':>9} {'us/line':>8}")
+    for num_accounts, history_length, lines, seconds in results:
+        print(f"{num_accounts:>8} {history_length:>8} {lines:>9} {seconds:>9.4f} {seconds / lines * 1e6:>8.2f}")
+    return results
+
+
+# converting text files to a snapshot and back must give the same files byte for byte
+def check_snapshot_round_trip(usernames):
+    # the files are first saved once by the text path, so both sides are in the form it writes
+    banking_system = BankingSystem()
+    banking_system.customers = BankingSystem.load_customers_from_file("customers.txt")
+    banking_system.load_all_account_details()
+    BankingSystem.save_account_details_to_file(banking_system.customers, "customer_files")
+    originals = {}
+    for filename in ["customers.txt"] + [f"{username}.txt" for username in usernames]:
+        with open(filename) as file:
+            originals[filename] = file.read()
+    BankingSystem.export_snapshot("customers.txt", "bank.snapshot")
+    for filename in originals:
+        os.remove(filename)
+    BankingSystem.import_snapshot("bank.snapshot", "customers.txt")
+    for filename, text in originals.items():
+        with open(filename) as file:
+            if file.read() != text:
+                raise AssertionError(f"{filename} changed after a snapshot round trip")
+
+
+# timing start up from customers.txt against start up from a snapshot, and the first login after it
+def bench_snapshot_startup(num_customers=100000, history_length=20, repeat=3):
+    start_date = datetime.datetime(2024, 1, 1)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            with open("customers.txt", 'w') as file:
+                for i in range(3):
+                    file.write(f"round{i},{password_hash()},Bench,Customer,Address {i}\n")
+            for i in range(3):
+                write_customer_file(f"round{i}", 3, 50)
+            check_snapshot_round_trip([f"round{i}" for i in range(3)])
+            print("text -> snapshot -> text round trip: identical")
+
+            banking_system = BankingSystem()
+            customers = []
+            for i in range(num_customers):
+                customer = Customer(f"user{i}", password_hash(), "First", "Last", f"Street {i}")
+                customer.accounts_loaded = True
+                account = SavingAccount(f"acc{i}", 100.0)
+                for j in range(history_length):
+                    account.add_transaction("Deposit", 5.0, start_date + datetime.timedelta(seconds=j))
+                customer.add_account(account)
+                customers.append(customer)
+            banking_system.customers = customers
+            BankingSystem.save_customers_to_file(customers, "customers.txt")
+            banking_system.save_snapshot("bank.snapshot")
+            del banking_system, customers, customer, account
+
+            text_startup = snapshot_startup = first_login = float("inf")
+            for _ in range(repeat):
+                banking_system = None # freeing the previous bank is not part of the timing
+                gc.collect()
+                start = time.perf_counter()
+                banking_system = BankingSystem()
+                banking_system.customers = BankingSystem.load_customers_from_file("customers.txt")
+                text_startup = min(text_startup, time.perf_counter() - start)
+
+                banking_system = None
+                gc.collect()
+                start = time.perf_counter()
+                banking_system = BankingSystem()
+                banking_system.load_snapshot("bank.snapshot")
+                snapshot_startup = min(snapshot_startup, time.perf_counter() - start)
+
+                start = time.perf_counter()
+                customer = banking_system.get_customer_by_username(f"user{num_customers // 2}")
+                banking_system.load_account_details_from_file(customer)
+                len(list(customer.accounts[0].get_transaction_history().rows()))
+                first_login = min(first_login, time.perf_counter() - start)
+        finally:
+            os.chdir(cwd)
+
+    print(f"customers: {num_customers}, transactions per customer: {history_length}")
+    print(f"start up from customers.txt: {text_startup * 1000:9.2f} ms")
+    print(f"start up from snapshot:      {snapshot_startup * 1000:9.2f} ms")
+    print(f"first login from snapshot:   {first_login * 1000:9.2f} ms")
+    return text_startup, snapshot_startup, first_login
+
+
+def make_month_end_accounts(num_accounts):
+    saving_accounts = [SavingAccount(f"s{i}", 100.0 + i % 1000, 2 + i % 7) for i in range(num_accounts // 2)]
+    loan_accounts = [LoanAccount(f"l{i}", 5000.0 + i % 1000, 3 + i % 5, 12 + i % 48) for i in range(num_accounts // 2)]
+    return saving_accounts, loan_accounts
+
+
+# timing month end over num_accounts accounts, half savings and half loans, per object against batched
+def bench_month_end(num_accounts=1000000, months=3):
+    timestamp = datetime.datetime(2024, 1, 31)
+
+    # batched results must match calling the per-object methods
+    saving_accounts, loan_accounts = make_month_end_accounts(1000)
+    batch_savings, batch_loans = make_month_end_accounts(1000)
+    for _ in range(months):
+        for account in saving_accounts:
+            account.credit_interest()
+        for account in loan_accounts:
+            account.pay_installment()
+        SavingAccount.credit_interest_batch(batch_savings, timestamp)
+        LoanAccount.pay_installment_batch(batch_loans, timestamp)
+    for account, batch_account in zip(saving_accounts + loan_accounts, batch_savings + batch_loans):
+        if (account.balance != batch_account.balance
+                or account.transaction_history.amounts != batch_account.transaction_history.amounts):
+            raise AssertionError(f"batch month end differs for account {account.account_number}")
+    print("batch month end matches per-object methods")
+
+    saving_accounts, loan_accounts = make_month_end_accounts(num_accounts)
+    per_object = batched = float("inf")
+    for _ in range(months):
+        start = time.perf_counter()
+        for account in saving_accounts:
+            account.credit_interest()
+        for account in loan_accounts:
+            account.pay_installment()
+        per_object = min(per_object, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        SavingAccount.credit_interest_batch(saving_accounts, timestamp)
+        LoanAccount.pay_installment_batch(loan_accounts, timestamp)
+        batched = min(batched, time.perf_counter() - start)
+
+    print(f"accounts: {num_accounts}, numpy: {'yes' if bank_system_code.optional_numpy() is not None else 'no'}")
+    print(f"per-object loop: {per_object:8.3f} s")
+    print(f"batched:         {batched:8.3f} s  ({per_object / batched:.1f}x)")
+    return per_object, batched
+
+
+# loans sharing a few sets of terms: schedules built for every loan against taken from the cache, and a payoff quote
+# after months installments against replaying those installments on a copy of the loan
+# the quotes must equal the balance of a loan that really paid its installments
+def bench_amortization(num_loans=100000, months=18):
+    terms = [(5000.0 + 2500 * (i % 4), 3 + i % 5, (12, 24, 36, 60)[i % 4]) for i in range(20)]
+    loans = [LoanAccount(f"l{i}", *terms[i % len(terms)]) for i in range(num_loans)]
+    for principal_amount, interest_rate, loan_duration in terms:
+        loan = LoanAccount("check", principal_amount, interest_rate, loan_duration)
+        for month in range(1, loan_duration + 1):
+            loan.pay_installment()
+            if loan.payoff_quote() != loan.balance or loan.remaining_balance_after(month) != loan.balance:
+                raise AssertionError(f"schedule differs from the installments paid for {terms}, month {month}")
+    print("schedules match the installments paid")
+
+    uncached = LoanAccount.amortization_schedule.__wrapped__
+    start = time.perf_counter()
+    for loan in loans:
+        uncached(loan.principal_amount, loan.interest_rate, loan.loan_duration)
+    built = time.perf_counter() - start
+    LoanAccount.amortization_schedule.cache_clear()
+    start = time.perf_counter()
+    for loan in loans:
+        loan.get_amortization_schedule()
+    cached = time.perf_counter() - start
+
+    sample = loans[:1000]
+    start = time.perf_counter()
+    for loan in sample:
+        replayed = LoanAccount(loan.account_number, loan.principal_amount, loan.interest_rate, loan.loan_duration)
+        for _ in range(min(months, loan.loan_duration)):
+            replayed.pay_installment()
+    replay = (time.perf_counter() - start) / len(sample)
+    start = time.perf_counter()
+    for loan in loans:
+        loan.remaining_balance_after(months)
+    lookup = (time.perf_counter() - start) / num_loans
+
+    print(f"loans: {num_loans}, distinct terms: {len(terms)}")
+    print(f"schedules built per loan: {built:8.3f} s   from the cache: {cached:8.3f} s  ({built / cached:.0f}x)")
+    print(f"balance after {months} months, replayed: {replay * 1e6:8.1f} us   from the schedule: {lookup * 1e6:8.2f} us")
+    return built, cached, replay, lookup
+
+
+# timing process_transaction_file on a CSV and a JSON lines file of num_records deposits and withdrawals
+def bench_batch_transactions(num_records=1000000, num_accounts=10000):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            with open("transactions.csv", 'w') as csv_file, open("transactions.jsonl", 'w') as json_file:
+                csv_file.write("account_number,op,amount\n")
+                for i in range(num_records):
+                    op = "deposit" if i % 3 else "withdraw"
+                    amount = 10 + i % 90
+                    csv_file.write(f"c{i % num_accounts},{op},{amount}\n")
+                    json_file.write(f'{{"account_number": "c{i % num_accounts}", "op": "{op}", "amount": {amount}}}\n')
+
+            results = []
+            for filename in ("transactions.csv", "transactions.jsonl"):
+                banking_system = BankingSystem()
+                customers = []
+                for i in range(num_accounts):
+                    customer = Customer(f"user{i}", password_hash(), "First", "Last", "Address")
+                    customer.accounts_loaded = True
+                    customer.add_account(CheckingAccount(f"c{i}", 100.0, 500.0, 25.0))
+                    customers.append(customer)
+                banking_system.customers = customers
+                gc.collect()
+                start = time.perf_counter()
+                applied, rejections = banking_system.process_transaction_file(filename)
+                seconds = time.perf_counter() - start
+                results.append((filename, applied, len(rejections), seconds))
+        finally:
+            os.chdir(cwd)
+
+    for filename, applied, rejected, seconds in results:
+        print(f"{filename:>18}: {applied} applied, {rejected} rejected, "
+              f"{seconds:.3f} s, {num_records / seconds:,.0f} transactions/s")
+    return results
+
+
+def read_customer_files(usernames):
+    contents = []
+    for username in usernames:
+        with open(f"{username}.txt") as file:
+            contents.append(file.read())
+    return contents
+
+
+# timing serial against process pool loading and saving of num_customers customer files
+def bench_parallel_load_save(num_customers=2000, history_length=100, workers=None, chunk_size=64):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            usernames = [f"user{i}" for i in range(num_customers)]
+            with open("customers.txt", 'w') as file:
+                for username in usernames:
+                    file.write(f"{username},{password_hash()},Bench,Customer,Address\n")
+                    write_customer_file(username, 3, history_length)
+
+            gc.collect()
+            banking_system = BankingSystem("customers.txt")
+            start = time.perf_counter()
+            serial_errors = []
+            for customer in banking_system.customers:
+                try:
+                    banking_system.load_account_details_from_file(customer)
+                except ValueError as e:
+                    serial_errors.append((customer.username, str(e)))
+            serial_load = time.perf_counter() - start
+            start = time.perf_counter()
+            BankingSystem.save_account_details_to_file(banking_system.customers, "customer_files")
+            serial_save = time.perf_counter() - start
+            serial_files = read_customer_files(usernames[1:])
+            with open("user0.txt", 'a') as file: # one unreadable file, the rest of the batch must still load
+                file.write("Account Type: BrokenAccount\nTransaction History:\n")
+            broken_file = read_customer_files(usernames[:1])
+
+            banking_system = None
+            gc.collect()
+            banking_system = BankingSystem("customers.txt")
+            start = time.perf_counter()
+            errors = banking_system.load_all_account_details_parallel(workers, chunk_size)
+            parallel_load = time.perf_counter() - start
+            start = time.perf_counter()
+            errors += banking_system.save_all_account_details_parallel(workers, chunk_size)
+            parallel_save = time.perf_counter() - start
+            if read_customer_files(usernames[1:]) != serial_files:
+                raise AssertionError("parallel save wrote different files than serial save")
+            if [username for username, _ in errors] != usernames[:1]:
+                raise AssertionError(f"expected only user0 to fail, got {errors}")
+            if read_customer_files(usernames[:1]) != broken_file:
+                raise AssertionError("the file that failed to load was overwritten")
+        finally:
+            os.chdir(cwd)
+
+    print(f"customers: {num_customers}, workers: {workers or os.cpu_count()}, chunk size: {chunk_size}")
+    print(f"errors reported: {errors}")
+    print(f"serial load:   {serial_load:8.3f} s   parallel load: {parallel_load:8.3f} s")
+    print(f"serial save:   {serial_save:8.3f} s   parallel save: {parallel_save:8.3f} s")
+    return serial_load, parallel_load, serial_save, parallel_save
+
+
+# timing indexed range queries against a full scan as the history grows to 1M rows
+def bench_history_queries(sizes=(10000, 100000, 1000000), repeat=200):
+    from bank_system_code import TransactionHistory
+    start_date = datetime.datetime(2020, 1, 1)
+    types = [TransactionHistory.type_code(name) for name in ("Deposit", "Withdrawal", "Withdrawal (Overdraft)")]
+    print(f"{'rows':>8} {'index build':>12} {'range query':>12} {'type+range':>12} {'full scan':>12}")
+    results = []
+    for size in sizes:
+        account = CheckingAccount("bench", 0.0)
+        history = account.get_transaction_history()
+        base = history.seconds(start_date)
+        for i in range(size):
+            history.append_encoded(base + 60 * i, types[i % 7 % 3], 100 * (i % 500))
+        # a one day window in the middle of the history
+        window_start = start_date + datetime.timedelta(seconds=60 * size // 2)
+        window_end = window_start + datetime.timedelta(days=1)
+
+        start = time.perf_counter()
+        account.query_transactions(window_start, window_end)
+        index_build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            account.query_transactions(window_start, window_end, limit=100)
+        range_query = (time.perf_counter() - start) / repeat
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            account.query_transactions(window_start, window_end, "Withdrawal (Overdraft)", limit=100)
+        type_query = (time.perf_counter() - start) / repeat
+
+        start = time.perf_counter()
+        [transaction for transaction in history.rows()
+         if window_start <= transaction[0] < window_end and transaction[1] == "Withdrawal (Overdraft)"]
+        full_scan = time.perf_counter() - start
+
+        results.append((size, index_build, range_query, type_query, full_scan))
+        print(f"{size:>8} {index_build * 1000:>10.2f}ms {range_query * 1e6:>10.1f}us "
+              f"{type_query * 1e6:>10.1f}us {full_scan * 1000:>10.2f}ms")
+    return results
+
+
+# one client session: log in, then alternate deposits and withdrawals, timing every request
+async def run_client_session(path, username, account_number, num_requests, latencies):
+    reader, writer = await asyncio.open_unix_connection(path)
+
+    async def call(request):
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        return json.loads(await reader.readline())
+
+    reply = await call({"op": "login", "username": username, "password": "password"})
+    if not reply["ok"]:
+        raise AssertionError(reply)
+    for i in range(num_requests):
+        request = {"op": "deposit" if i % 2 else "withdraw", "account_number": account_number, "amount": 10}
+        start = time.perf_counter()
+        reply = await call(request)
+        latencies.append(time.perf_counter() - start)
+        if not reply["ok"]:
+            raise AssertionError(reply)
+    await call({"op": "quit"})
+    writer.close()
+
+
+async def run_load(path, num_sessions, num_customers, num_requests):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client_session(path, f"user{i % num_customers}", f"c{i % num_customers}",
+                                              num_requests, latencies)
+                           for i in range(num_sessions)))
+    return time.perf_counter() - start, latencies
+
+
+# local load generator: num_sessions concurrent sessions against a server process on a Unix socket
+# several sessions share each account so the per-customer locks are exercised; balances are checked afterwards
+def bench_server(num_sessions=2000, num_customers=200, num_requests=50):
+    server_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bank_system_code.py")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            customers = []
+            for i in range(num_customers):
+                customer = Customer(f"user{i}", password_hash(), "First", "Last", "Address")
+                customer.accounts_loaded = True
+                customer.add_account(CheckingAccount(f"c{i}", 1000000.0))
+                customers.append(customer)
+            BankingSystem.save_customers_to_file(customers, "customers.txt")
+            BankingSystem.save_account_details_to_file(customers, "customer_files")
+
+            path = os.path.join(directory, "bank.sock")
+            server = subprocess.Popen([sys.executable, server_script, "--serve-unix", path])
+            try:
+                while not os.path.exists(path):
+                    time.sleep(0.05)
+                seconds, latencies = asyncio.run(run_load(path, num_sessions, num_customers, num_requests))
+            finally:
+                server.send_signal(signal.SIGINT)
+                server.wait()
+
+            # every session withdrew and deposited 10 the same number of times
+            withdrawals_per_account = (num_sessions // num_customers) * ((num_requests + 1) // 2)
+            deposits_per_account = (num_sessions // num_customers) * (num_requests // 2)
+            banking_system = BankingSystem("customers.txt")
+            customer = banking_system.get_customer_by_username("user0")
+            banking_system.load_account_details_from_file(customer)
+            expected = 1000000.0 + 10 * (deposits_per_account - withdrawals_per_account)
+            if customer.accounts[0].balance != expected:
+                raise AssertionError(f"balance {customer.accounts[0].balance}, expected {expected}")
+        finally:
+            os.chdir(cwd)
+
+    latencies.sort()
+    print(f"sessions: {num_sessions}, requests: {len(latencies)}, balances consistent")
+    print(f"throughput: {len(latencies) / seconds:,.0f} requests/s")
+    print(f"latency p50: {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+          f"p99: {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+    return seconds, latencies
+
+
+async def run_durable_writers(accounts, journal, per_writer, latencies):
+    async def writer(account):
+        for _ in range(per_writer):
+            start = time.perf_counter()
+            account.deposit(1.0, quiet=True)
+            await journal.wait_async()
+            latencies.append(time.perf_counter() - start)
+    await asyncio.gather(*(writer(account) for account in accounts))
+
+
+# durable transactions per second for several group commit windows, each writer waits for its commit
+def bench_journal(windows=(0, 0.001, 0.005, 0.02), writers=(1, 100, 1000), duration_transactions=20000):
+    from bank_system_code import TransactionJournal
+    cwd = os.getcwd()
+    print(f"{'window':>8} {'writers':>8} {'tx/s':>10} {'p99 ms':>8}")
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            for window in windows:
+                for num_writers in writers:
+                    journal = TransactionJournal("bank.journal", window)
+                    TransactionJournal.active = journal
+                    accounts = [CheckingAccount(f"c{i}", 0.0) for i in range(num_writers)]
+                    per_writer = max(1, min(duration_transactions // num_writers, 2000 if window else 200))
+                    latencies = []
+                    start = time.perf_counter()
+                    asyncio.run(run_durable_writers(accounts, journal, per_writer, latencies))
+                    seconds = time.perf_counter() - start
+                    journal.close()
+                    os.remove("bank.journal")
+                    latencies.sort()
+                    p99 = latencies[int(len(latencies) * 0.99)]
+                    results.append((window, num_writers, len(latencies) / seconds, p99))
+                    print(f"{window * 1000:>6.1f}ms {num_writers:>8} {len(latencies) / seconds:>10,.0f} {p99 * 1000:>8.2f}")
+        finally:
+            TransactionJournal.active = None
+            os.chdir(cwd)
+    return results
+
+
+# logins per second for several key derivation costs: one thread, the thread pool, and repeated logins from the cache
+def bench_logins(settings=(("scrypt", 2 ** 12), ("scrypt", 2 ** 14), ("pbkdf2_sha256", 100000),
+                           ("pbkdf2_sha256", 600000)), num_logins=64, workers=None):
+    workers = workers or os.cpu_count()
+    print(f"{'algorithm':>14} {'cost':>8} {'1 thread/s':>11} {'pool/s':>9} {'per core/s':>11} {'cached/s':>10}")
+    results = []
+    for algorithm, cost in settings:
+        hasher = PasswordHasher(algorithm, cost, workers=workers, cache_size=0)
+        encoded = [hasher.hash(f"password{i}") for i in range(num_logins)]
+        logins = [(f"password{i}", encoded[i]) for i in range(num_logins)]
+
+        start = time.perf_counter()
+        if not all(hasher.verify(password, stored) for password, stored in logins):
+            raise AssertionError("verification failed")
+        single = num_logins / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        if not all(hasher.executor().map(lambda login: hasher.verify(*login), logins)):
+            raise AssertionError("verification failed")
+        pooled = num_logins / (time.perf_counter() - start)
+        hasher.executor().shutdown()
+
+        hasher = PasswordHasher(algorithm, cost)
+        hasher.verify(*logins[0])
+        start = time.perf_counter()
+        for _ in range(100000):
+            hasher.verify(*logins[0])
+        cached = 100000 / (time.perf_counter() - start)
+
+        results.append((algorithm, cost, single, pooled, cached))
+        print(f"{algorithm:>14} {cost:>8} {single:>11,.1f} {pooled:>9,.1f} {pooled / workers:>11,.1f} {cached:>10,.0f}")
+    return results
+
+
+# strftime/strptime against TimestampCodec on num_lines ledger timestamps, one every step seconds, in chunks
+def bench_timestamps(num_lines=10000000, step=7, chunk_size=100000):
+    from bank_system_code import TimestampCodec, TransactionHistory
+    epoch, timedelta, strptime = TransactionHistory.EPOCH, datetime.timedelta, datetime.datetime.strptime
+    base = TransactionHistory.seconds(datetime.datetime(2024, 1, 1))
+    times = {"strftime": 0.0, "codec format": 0.0, "strptime": 0.0, "codec parse": 0.0}
+    for chunk_start in range(0, num_lines, chunk_size):
+        seconds = range(base + chunk_start * step, base + min(chunk_start + chunk_size, num_lines) * step, step)
+
+        start = time.perf_counter()
+        texts = [(epoch + timedelta(seconds=second)).strftime(TimestampCodec.FORMAT) for second in seconds]
+        times["strftime"] += time.perf_counter() - start
+        start = time.perf_counter()
+        codec_texts = [TimestampCodec.format(second) for second in seconds]
+        times["codec format"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        [strptime(text, TimestampCodec.FORMAT) for text in texts]
+        times["strptime"] += time.perf_counter() - start
+        start = time.perf_counter()
+        parsed = [TimestampCodec.parse(text) for text in texts]
+        times["codec parse"] += time.perf_counter() - start
+
+        if codec_texts != texts or parsed != list(seconds):
+            raise AssertionError(f"codec disagrees with strftime/strptime in chunk at line {chunk_start}")
+
+    print(f"lines: {num_lines}, codec output identical to strftime/strptime")
+    for name, seconds in times.items():
+        print(f"{name:>14}: {seconds:8.3f} s {seconds / num_lines * 1e9:8.0f} ns/line")
+    print(f"format speed up: {times['strftime'] / times['codec format']:.1f}x, "
+          f"parse speed up: {times['strptime'] / times['codec parse']:.1f}x")
+    return times
+
+
+# cost of a deposit with metrics disabled, enabled, and disabled again after enable() and disable()
+def bench_metrics(num_deposits=1000000):
+    from bank_system_code import Metrics
+    results = {}
+    for label in ("disabled", "enabled", "disabled again"):
+        if label == "enabled":
+            Metrics.enable()
+        elif label == "disabled again":
+            Metrics.disable()
+        account = CheckingAccount("metrics", 0.0)
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(num_deposits):
+            account.deposit(1.0, quiet=True)
+        results[label] = (time.perf_counter() - start) / num_deposits
+        print(f"{label:>15}: {results[label] * 1e9:8.0f} ns/deposit")
+    print(f"overhead when enabled: {(results['enabled'] - results['disabled']) * 1e9:.0f} ns/deposit")
+    return results
+
+
+# posting num_transactions deposits and withdrawals and a month of interest over num_accounts balances, kept as floats
+# (as accounts did before Money), as whole cents the way Account keeps a Money balance, and as Decimal
+# the cents and Decimal results must agree to the cent, the float drift is reported
+# this is the bare arithmetic, bench_account_postings compares deposits and withdrawals made through accounts
+def bench_money(num_transactions=1000000, num_accounts=100000, repeat=3):
+    from decimal import ROUND_HALF_EVEN, Decimal
+    from bank_system_code import Money
+    rng = random.Random(19)
+    amounts = [rng.randrange(1, 100000) / 100 for _ in range(num_transactions)] # as parsed from the menus
+    starting = [rng.randrange(0, 10000000) / 100 for _ in range(num_accounts)]
+    rates = [rng.choice((1.5, 2, 2.5, 3.75, 5, 7.2)) for _ in range(num_accounts)]
+    cent = Decimal("0.01")
+
+    def post_float():
+        balances, ledger = list(starting), []
+        for i, amount in enumerate(amounts):
+            if i & 1:
+                amount = -amount
+            balances[i % num_accounts] += amount
+            ledger.append(round(amount * 100))
+        for i, rate in enumerate(rates):
+            interest = balances[i] * (rate / 100) / 12
+            balances[i] += interest
+            ledger.append(round(interest * 100))
+        return [round(balance * 100) for balance in balances], ledger
+
+    def post_money():
+        cents_of, scale_cents = Money.cents_of, Money.scale_cents
+        balances, ledger = [cents_of(balance) for balance in starting], []
+        for i, amount in enumerate(amounts):
+            cents = cents_of(amount)
+            if i & 1:
+                cents = -cents
+            balances[i % num_accounts] += cents
+            ledger.append(cents)
+        for i, rate in enumerate(rates):
+            interest = scale_cents(balances[i], rate, 1200)
+            balances[i] += interest
+            ledger.append(interest)
+        return balances, ledger
+
+    def post_decimal():
+        balances = [Decimal(repr(balance)).quantize(cent, ROUND_HALF_EVEN) for balance in starting]
+        ledger = []
+        for i, amount in enumerate(amounts):
+            amount = Decimal(repr(amount)).quantize(cent, ROUND_HALF_EVEN)
+            if i & 1:
+                amount = -amount
+            balances[i % num_accounts] += amount
+            ledger.append(int(amount * 100))
+        for i, rate in enumerate(rates):
+            interest = (balances[i] * Decimal(repr(rate)) / 1200).quantize(cent, ROUND_HALF_EVEN)
+            balances[i] += interest
+            ledger.append(int(interest * 100))
+        return [int(balance * 100) for balance in balances], ledger
+
+    times, results = {}, {}
+    for label, post in (("float", post_float), ("Money", post_money), ("Decimal", post_decimal)):
+        times[label] = float("inf")
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            results[label] = post()
+            times[label] = min(times[label], time.perf_counter() - start)
+    if results["Money"] != results["Decimal"]:
+        raise AssertionError("Money and Decimal postings differ")
+    drifted = sum(a != b for a, b in zip(results["float"][0], results["Money"][0]))
+
+    operations = num_transactions + num_accounts
+    print(f"transactions: {num_transactions}, accounts: {num_accounts}, Money matches Decimal to the cent")
+    for label in ("float", "Money", "Decimal"):
+        print(f"{label:>8}: {times[label]:7.3f} s  {operations / times[label]:12,.0f} postings/s  "
+              f"{times['float'] / times[label]:5.2f}x float")
+    print(f"float balances off by at least a cent: {drifted}")
+    return times
+
+
+# the checking account as it was before Money, kept here as the baseline of bench_account_postings: a float balance,
+# amounts rounded to cents only for the history, statistics and journaling as Account records them
+class FloatCheckingAccount(CheckingAccount):
+    __slots__ = ("float_balance",)
+
+    def __init__(self, account_number, balance=0, credit_limit=0, overdraft_fee=0):
+        super().__init__(account_number, balance)
+        self.float_balance = self.min_balance_cents = self.max_balance_cents = balance
+        self.credit_limit = credit_limit
+        self.overdraft_fee = overdraft_fee
+
+    def add_transaction(self, transaction_type, amount, timestamp=None):
+        history = self.transaction_history
+        cents = round(amount * 100)
+        seconds = history.seconds(timestamp or datetime.datetime.now())
+        history.append_encoded(seconds, history.type_code(transaction_type), cents)
+        self.record_statistics(transaction_type, cents)
+        self.dirty = True
+        if bank_system_code.TransactionJournal.active is not None:
+            bank_system_code.TransactionJournal.active.record_transaction(self, seconds, transaction_type, cents)
+
+    def record_statistics(self, transaction_type, cents):
+        if self.type_counts is None:
+            return
+        self.type_counts[transaction_type] = self.type_counts.get(transaction_type, 0) + 1
+        self.type_sums[transaction_type] = self.type_sums.get(transaction_type, 0) + cents
+        if self.float_balance < self.min_balance_cents:
+            self.min_balance_cents = self.float_balance
+        elif self.float_balance > self.max_balance_cents:
+            self.max_balance_cents = self.float_balance
+
+    def deposit(self, amount, quiet=False):
+        self.float_balance += amount
+        self.add_transaction("Deposit", amount)
+
+    def withdraw(self, amount, quiet=False):
+        if self.float_balance + self.credit_limit >= amount:
+            if self.float_balance >= amount:
+                self.float_balance -= amount
+                self.add_transaction("Withdrawal", -amount)
+            else:
+                overdraft_amount = amount - self.float_balance
+                self.float_balance = 0
+                self.float_balance -= overdraft_amount
+                self.float_balance -= self.overdraft_fee
+                self.add_transaction("Withdrawal (Overdraft)", -amount)
+        else:
+            raise ValueError("Insufficient balance with credit limit.")
+
+
+# deposits and withdrawals posted through checking accounts keeping Money balances, against FloatCheckingAccount,
+# with the float amounts the menus parse and with whole amounts
+def bench_account_postings(num_postings=300000, num_accounts=1000, repeat=5):
+    rng = random.Random(19)
+    amounts = {
+        "float": [rng.randrange(1, 100000) / 100 for _ in range(num_postings)],
+        "whole": [rng.randrange(1, 1000) for _ in range(num_postings)],
+    }
+
+    def post(account_class, postings):
+        accounts = [account_class(f"c{i}", 1000.0, 500.0, 25.0) for i in range(num_accounts)]
+        gc.collect()
+        start = time.perf_counter()
+        for i, amount in enumerate(postings):
+            account = accounts[i % num_accounts]
+            if i & 1:
+                account.deposit(amount, quiet=True)
+            else:
+                try:
+                    account.withdraw(amount, quiet=True)
+                except ValueError:
+                    pass
+        return time.perf_counter() - start
+
+    print(f"postings: {num_postings}, accounts: {num_accounts}")
+    results = {}
+    for label, postings in amounts.items():
+        # alternating the two so a noisy stretch of the machine falls on both
+        float_time = money_time = float("inf")
+        for _ in range(repeat):
+            float_time = min(float_time, post(FloatCheckingAccount, postings))
+            money_time = min(money_time, post(CheckingAccount, postings))
+        results[label] = float_time / money_time
+        print(f"{label:>8} amounts: float {num_postings / float_time:12,.0f} postings/s  "
+              f"Money {num_postings / money_time:12,.0f} postings/s  {results[label]:5.2f}x float")
+    return results
+
+
+# memory held by num_customers resident customers with a checking, a savings and a loan account each, then by
+# file_customers customers loaded from account files of history_length transactions per account, before and after
+# every history is read
+def bench_memory(num_customers=1000000, file_customers=20000, history_length=50):
+    import tracemalloc
+    results = {}
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    customers = []
+    for i in range(num_customers):
+        customer = Customer(f"user{i}", password_hash(), "First", "Last", f"Street {i}")
+        customer.accounts_loaded = True
+        customer.add_account(CheckingAccount(f"c{i}", 100.0, 500.0, 2.5))
+        customer.add_account(SavingAccount(f"s{i}", 2500.0, 2.5))
+        customer.add_account(LoanAccount(f"l{i}", 5000.0, 3, 24))
+        customers.append(customer)
+    gc.collect()
+    results["resident"] = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del customers, customer
+    gc.collect()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            usernames = [f"user{i}" for i in range(file_customers)]
+            for username in usernames:
+                write_customer_file(username, 3, history_length)
+            gc.collect()
+            tracemalloc.start()
+            start = tracemalloc.get_traced_memory()[0]
+            customers = []
+            for username in usernames:
+                customer = Customer(username, password_hash(), "Bench", "Customer", "Address")
+                BankingSystem.load_account_details_from_file(customer)
+                customers.append(customer)
+            gc.collect()
+            results["loaded"] = tracemalloc.get_traced_memory()[0] - start
+            for customer in customers:
+                for account in customer.accounts:
+                    len(account.get_transaction_history().query())
+            gc.collect()
+            results["histories read"] = tracemalloc.get_traced_memory()[0] - start
+            tracemalloc.stop()
+        finally:
+            os.chdir(cwd)
+
+    print(f"{num_customers} customers x 3 accounts resident: {results['resident'] / 2 ** 20:8.1f} MiB, "
+          f"{results['resident'] / num_customers:6.0f} bytes/customer")
+    print(f"{file_customers} customers from files, {history_length} transactions per account:")
+    print(f"  after loading:       {results['loaded'] / 2 ** 20:8.1f} MiB")
+    print(f"  after every history: {results['histories read'] / 2 ** 20:8.1f} MiB")
+    return results
+
+
+# flat customers.txt against a sharded storage at num_customers customers: migration, a lookup right after start up,
+# the next 100 lookups, lookups once everything is loaded, and registrations each followed by writing the registry
+# as a checkpoint does
+def bench_sharded_registry(num_customers=1000000, shards=256, lookups=100000, flat_registrations=3,
+                           sharded_registrations=200):
+    from bank_system_code import ShardedStorage
+    rng = random.Random(18)
+    cwd = os.getcwd()
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            with open("customers.txt", 'w') as file:
+                for i in range(num_customers):
+                    file.write(f"user{i},{password_hash()},First,Last,Street {i}\n")
+            shutil.copy("customers.txt", "flat.txt")
+            start = time.perf_counter()
+            ShardedStorage.migrate("customers.txt", "customer_files", shards)
+            results["migration"] = time.perf_counter() - start
+
+            names = [f"user{rng.randrange(num_customers)}" for _ in range(lookups)]
+            for layout in ("flat", "sharded"):
+                gc.collect()
+                start = time.perf_counter()
+                banking_system = BankingSystem("flat.txt")
+                if layout == "sharded":
+                    banking_system.open_storage("customer_files")
+                if banking_system.get_customer_by_username(names[0]) is None:
+                    raise AssertionError(f"{names[0]} not found")
+                results[f"{layout} first lookup"] = time.perf_counter() - start
+
+                start = time.perf_counter()
+                for name in names[:100]:
+                    banking_system.get_customer_by_username(name)
+                results[f"{layout} cold lookups"] = time.perf_counter() - start
+                results[f"{layout} customers loaded"] = len(banking_system.customers_by_username)
+
+                banking_system.load_customers()
+                start = time.perf_counter()
+                for name in names:
+                    banking_system.get_customer_by_username(name)
+                results[f"{layout} lookup"] = (time.perf_counter() - start) / lookups
+
+                registrations = flat_registrations if layout == "flat" else sharded_registrations
+                start = time.perf_counter()
+                for i in range(registrations):
+                    customer = Customer(f"new{i}", password_hash(), "New", "Customer", "Address")
+                    banking_system.add_new_customer(customer)
+                    banking_system.write_registry()
+                results[f"{layout} registration"] = (time.perf_counter() - start) / registrations
+                del banking_system, customer
+                ShardedStorage.active = None
+        finally:
+            ShardedStorage.active = None
+            os.chdir(cwd)
+
+    print(f"customers: {num_customers}, shards: {shards}, migration: {results['migration']:.2f} s")
+    print(f"{'layout':>8} {'first lookup':>13} {'next 100':>10} {'loaded':>9} {'warm lookup':>12} {'registration':>13}")
+    for layout in ("flat", "sharded"):
+        print(f"{layout:>8} {results[f'{layout} first lookup'] * 1000:>11.1f}ms "
+              f"{results[f'{layout} cold lookups'] * 1000:>8.1f}ms {results[f'{layout} customers loaded']:>9} "
+              f"{results[f'{layout} lookup'] * 1e9:>10.0f}ns {results[f'{layout} registration'] * 1000:>11.2f}ms")
+    return results
+
+
+FIRST_NAMES = ["Ayesha", "Bilal", "Carmen", "Daniel", "Elena", "Farhan", "Grace", "Hamza", "Irene", "Jamal", "Kiran",
+               "Liam", "Maria", "Noor", "Oscar", "Priya", "Quentin", "Rosa", "Sana", "Tomas", "Usman", "Vera", "Wei",
+               "Yusuf", "Zara"]
+LAST_NAMES = ["Ahmed", "Brown", "Chen", "Dubois", "Evans", "Fischer", "Garcia", "Hussain", "Ivanova", "Jones", "Khan",
+              "Lopez", "Malik", "Nguyen", "Okafor", "Patel", "Qureshi", "Rossi", "Smith", "Tanaka", "Usmani", "Volkov",
+              "Williams", "Yilmaz", "Zhou"]
+STREETS = ["Mall Road", "High Street", "Canal Bank", "Station Road", "Park Avenue", "Church Lane", "Mill Road",
+           "Garden Town", "Queens Road", "Model Town"]
+WORKLOAD_START = 1704067200 # 2024-01-01 00:00:00, in seconds since 1970-01-01
+MONTH = 30 * 86400
+
+
+# one account's transactions as (seconds, type, cents) with its closing balance in cents, following the rules of
+# the account classes: checking withdrawals past the balance go into the credit limit and pay the overdraft fee,
+# savings get a monthly interest credit at the rate SavingAccount is loaded with, loans pay monthly installments at 10%
+# also returns the lines written between the balance and the history, a loan's terms
+def generate_account(rng, account_type, history_length):
+    seconds = WORKLOAD_START + rng.randrange(MONTH)
+    rows = []
+    if account_type == "LoanAccount":
+        principal = rng.randrange(1000, 50000) * 100
+        duration = rng.choice((12, 24, 36, 60))
+        payment = LoanAccount.annuity_payment(principal / 100, 10, duration).cents
+        balance = principal
+        for _ in range(min(history_length, duration - 1)):
+            seconds += MONTH
+            principal_payment = payment - Money.scale_cents(balance, 10, 1200)
+            balance -= principal_payment
+            rows.append((seconds, "Loan Installment", -principal_payment))
+        terms = [f"Principal Amount: {Money(principal)}", "Interest Rate: 10.0", f"Loan Duration: {duration}",
+                 f"Installments Paid: {len(rows)}"]
+        return rows, balance, terms
+
+    balance = rng.randrange(0, 500000)
+    credit_limit, overdraft_fee = rng.choice((25000, 50000, 100000)), rng.choice((1000, 2500, 3500))
+    next_interest = seconds + MONTH
+    while len(rows) < history_length:
+        seconds += rng.randrange(600, 3 * 86400)
+        if account_type == "SavingAccount" and seconds >= next_interest:
+            interest = Money.scale_cents(balance, 10, 1200)
+            balance += interest
+            rows.append((next_interest, "Interest Credit", interest))
+            next_interest += MONTH
+            continue
+        cents = max(1, int(rng.lognormvariate(8.5, 1.2))) # around $50, now and then several thousand
+        if rng.random() < 0.45:
+            balance += cents
+            rows.append((seconds, "Deposit", cents))
+        elif balance >= cents:
+            balance -= cents
+            rows.append((seconds, "Withdrawal", -cents))
+        elif account_type == "CheckingAccount" and balance + credit_limit >= cents:
+            balance -= cents + overdraft_fee
+            rows.append((seconds, "Withdrawal (Overdraft)", -cents))
+    return rows, balance, []
+
+
+# writing a seeded bank of num_customers customers to the working directory, in the same format the banking system
+# saves: customers.txt, and one account file per customer holding one to three accounts
+# account types are drawn with the given weights, each account has around history_length transactions (half to one
+# and a half times as many), every customer's password is "password"
+# with shards, the bank is then migrated into a sharded storage in customer_files, as --migrate-storage does
+# returns the usernames and the number of accounts and transactions written
+def generate_workload(num_customers, history_length=50, seed=21,
+                      account_mix=(("CheckingAccount", 0.5), ("SavingAccount", 0.3), ("LoanAccount", 0.2)),
+                      shards=None):
+    rng = random.Random(seed)
+    account_types = [account_type for account_type, _ in account_mix]
+    weights = [weight for _, weight in account_mix]
+    disk_format = TimestampCodec.disk_format()
+    usernames = []
+    num_accounts = num_transactions = 0
+    with open("customers.txt", 'w') as registry:
+        for i in range(num_customers):
+            first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            username = f"{first_name.lower()}.{last_name.lower()}{i}"
+            address = f"{rng.randrange(1, 500)} {rng.choice(STREETS)}"
+            registry.write(f"{username},{password_hash()},{first_name},{last_name},{address}\n")
+            usernames.append(username)
+            with open(bank_system_code.ledger_filename(username), 'w') as file:
+                file.write(f"Customer: {first_name} {last_name}\n")
+                for account_type in rng.choices(account_types, weights, k=rng.choice((1, 1, 2, 2, 2, 3))):
+                    rows, balance, terms = generate_account(
+                        rng, account_type, rng.randint(history_length // 2, history_length * 3 // 2))
+                    file.write(f"Account Type: {account_type}\n")
+                    file.write(f"Account Number: {10000000 + num_accounts}\n")
+                    file.write(f"Balance: {Money(balance)}\n")
+                    for line in terms:
+                        file.write(f"{line}\n")
+                    file.write("Transaction History:\n")
+                    for seconds, transaction_type, cents in rows:
+                        file.write(f"{disk_format(seconds)} - {transaction_type}: {cents / 100}\n")
+                    file.write("\n")
+                    num_accounts += 1
+                    num_transactions += len(rows)
+    if shards:
+        ShardedStorage.migrate("customers.txt", "customer_files", shards)
+    return usernames, num_accounts, num_transactions
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# end to end run over a generated bank, started the way main starts it: start up, loading every account file,
+# logins, deposits and withdrawals, month end, the checkpoint a logout makes and a full save
+# logins verify the password hash every time, the login cache is emptied before each one
+# one JSON record per run is appended to results (relative to the directory the benchmark is started from), and
+# compared with the last earlier record with the same parameters, so runs at different commits can be compared
+def bench_end_to_end(num_customers=20000, history_length=50, seed=21, logins=50, transactions=200000, shards=None,
+                     results="end_to_end.jsonl"):
+    parameters = {"num_customers": num_customers, "history_length": history_length, "seed": seed, "logins": logins,
+                  "transactions": transactions, "shards": shards}
+    workload, metrics = {}, {}
+    results = os.path.abspath(results)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            password_hash()
+            start = time.perf_counter()
+            usernames, num_accounts, num_transactions = generate_workload(num_customers, history_length, seed,
+                                                                          shards=shards)
+            metrics["generate_s"] = time.perf_counter() - start
+            workload["accounts"], workload["transactions_on_file"] = num_accounts, num_transactions
+            gc.collect()
+
+            start = time.perf_counter()
+            banking_system = BankingSystem("customers.txt")
+            if ShardedStorage.exists("customer_files"):
+                banking_system.open_storage("customer_files")
+            journal = banking_system.open_journal("bank.journal")
+            banking_system.load_customers()
+            metrics["startup_s"] = time.perf_counter() - start
+            try:
+                rng = random.Random(seed)
+                latencies = []
+                for username in rng.sample(usernames, min(logins, num_customers)):
+                    PasswordHasher.active.cache.clear()
+                    start = time.perf_counter()
+                    customer = banking_system.get_customer_by_username(username)
+                    if not customer.check_password("password"):
+                        raise AssertionError(f"login failed for {username}")
+                    banking_system.load_account_details_from_file(customer)
+                    latencies.append(time.perf_counter() - start)
+                metrics["login_p50_ms"] = percentile(latencies, 0.5) * 1000
+                metrics["login_p99_ms"] = percentile(latencies, 0.99) * 1000
+
+                start = time.perf_counter()
+                banking_system.load_all_account_details()
+                metrics["load_all_s"] = time.perf_counter() - start
+
+                accounts = [account for customer in banking_system.customers for account in customer.accounts
+                            if not isinstance(account, LoanAccount)]
+                operations = [(rng.choice(accounts), rng.random() < 0.5, rng.randrange(100, 50000) / 100)
+                              for _ in range(transactions)]
+                rejected = 0
+                gc.collect()
+                start = time.perf_counter()
+                for account, deposit, amount in operations:
+                    if deposit:
+                        account.deposit(amount, quiet=True)
+                    else:
+                        try:
+                            account.withdraw(amount, quiet=True)
+                        except ValueError:
+                            rejected += 1
+                journal.wait()
+                seconds = time.perf_counter() - start
+                metrics["transactions_per_s"] = transactions / seconds
+                workload["rejected_withdrawals"] = rejected
+
+                start = time.perf_counter()
+                banking_system.process_month_end(datetime.datetime(2025, 1, 31, 23, 59, 59))
+                metrics["month_end_s"] = time.perf_counter() - start
+
+                start = time.perf_counter()
+                banking_system.checkpoint()
+                metrics["checkpoint_s"] = time.perf_counter() - start
+
+                start = time.perf_counter()
+                banking_system.save_registry()
+                banking_system.save_account_details_to_file(banking_system.customers, "customer_files")
+                metrics["full_save_s"] = time.perf_counter() - start
+            finally:
+                journal.close()
+                ShardedStorage.active = None
+        finally:
+            os.chdir(cwd)
+
+    record = {"commit": git_commit(), "time": datetime.datetime.now().isoformat(timespec="seconds"),
+              "python": sys.version.split()[0], "parameters": parameters, "workload": workload, "metrics": metrics}
+    previous = None
+    if os.path.exists(results):
+        with open(results) as file:
+            for line in file:
+                earlier = json.loads(line)
+                if earlier["parameters"] == parameters:
+                    previous = earlier
+    with open(results, 'a') as file:
+        file.write(json.dumps(record) + "\n")
+
+    print(f"{num_customers} customers, {num_accounts} accounts, {num_transactions} transactions on file, "
+          f"{rejected} of {transactions} deposits and withdrawals rejected")
+    if previous is not None:
+        print(f"compared with {previous['commit']} ({previous['time']})")
+    for name, value in metrics.items():
+        line = f"{name:>20}: {value:14,.3f}"
+        if previous is not None and previous["metrics"].get(name):
+            line += f"  {value / previous['metrics'][name]:6.2f}x"
+        print(line)
+    print(f"results appended to {results}")
+    return record
+
+
+BENCHMARKS = {
+    "load": bench_load_account_details,
+    "snapshot": bench_snapshot_startup,
+    "month_end": bench_month_end,
+    "amortization": bench_amortization,
+    "batch": bench_batch_transactions,
+    "parallel": bench_parallel_load_save,
+    "query": bench_history_queries,
+    "server": bench_server,
+    "journal": bench_journal,
+    "logins": bench_logins,
+    "timestamps": bench_timestamps,
+    "metrics": bench_metrics,
+    "sharded": bench_sharded_registry,
+    "money": bench_money,
+    "account_postings": bench_account_postings,
+    "memory": bench_memory,
+    "end_to_end": bench_end_to_end,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"\n--- {name} ---")
+        BENCHMARKS[name]()
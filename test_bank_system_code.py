@@ -0,0 +1,599 @@
+import asyncio
+import contextlib
+import json
+import os
+import random
+import time
+from decimal import ROUND_HALF_EVEN, Decimal
+
+import pytest
+
+from bank_system_code import (BankingSystem, BankingSystemServer, CheckingAccount, Customer, LoanAccount, Money,
+                              PasswordHasher, SavingAccount, TransactionJournal, main)
+
+
+# a loan's balance, its payoff quote and the schedule describe the same loan, installment by installment
+def test_loan_balance_follows_schedule():
+    loan = LoanAccount("L1", 1000.0, 7, 12)
+    assert loan.get_remaining_balance() == loan.payoff_quote() == Money.of(1000)
+    schedule = loan.get_amortization_schedule()
+    for month in range(1, 13):
+        interest_payment, principal_payment, remaining = schedule[month - 1]
+        assert loan.pay_installment() == principal_payment
+        assert loan.get_remaining_balance() == loan.payoff_quote() == loan.remaining_balance_after(month) == remaining
+    assert loan.balance == Money(0)
+    assert loan.is_paid_off()
+    with pytest.raises(ValueError):
+        loan.pay_installment()
+
+
+def test_loan_installment_batch_matches_pay_installment():
+    loans = [LoanAccount(f"L{i}", 1000.0 + i, 3 + i % 5, 6) for i in range(10)]
+    batch_loans = [LoanAccount(f"L{i}", 1000.0 + i, 3 + i % 5, 6) for i in range(10)]
+    for _ in range(8): # two months past the end of every loan
+        for loan in loans:
+            if not loan.is_paid_off():
+                loan.pay_installment()
+        LoanAccount.pay_installment_batch(batch_loans)
+    for loan, batch_loan in zip(loans, batch_loans):
+        assert loan.balance == batch_loan.balance == Money(0)
+        assert loan.transaction_history.amounts == batch_loan.transaction_history.amounts
+
+
+def decimal_cents(value):
+    return int((Decimal(repr(value) if isinstance(value, float) else str(value)) * 100).to_integral_value(ROUND_HALF_EVEN))
+
+
+# amounts are rounded to the cent half to even on their decimal value, whether or not the float fast path takes them
+def test_cents_of_rounds_half_to_even():
+    assert [Money.cents_of(amount) for amount in (0.125, 0.135, 1.005, 2.675, "1.005", 12.34, -0.125)] == [
+        12, 14, 100, 268, 100, 1234, -12]
+    assert Money.cents_of(7) == 700 and Money.cents_of(True) == 100 and Money.cents_of(Money(5)) == 5
+    rng = random.Random(4)
+    for _ in range(20000):
+        amount = rng.choice((rng.randrange(-10 ** 15, 10 ** 15) / 100, rng.uniform(-1e6, 1e6),
+                             rng.randrange(10 ** 6) / 1000))
+        assert Money.cents_of(amount) == decimal_cents(amount), amount
+
+
+def test_cents_of_bounds():
+    assert Money.cents_of(1e13) == Money.cents_of(10 ** 13) == Money.MAX_CENTS
+    assert Money.cents_of(-1e13) == -Money.MAX_CENTS
+    for amount in (1e13 + 0.01, 10 ** 13 + 1, 1e17, -1e17, "1e17"):
+        with pytest.raises(ValueError, match="too large"):
+            Money.cents_of(amount)
+    for amount in (float("nan"), float("inf"), -float("inf")):
+        with pytest.raises(ValueError, match="finite"):
+            Money.cents_of(amount)
+
+
+# cents * multiplier / divisor rounded once, half to even, as the exact fraction would be
+def test_scale_cents_rounds_half_to_even():
+    assert [Money.scale_cents(cents, 1, 10) for cents in (25, 35, -25, 24, 26)] == [2, 4, -2, 2, 3]
+    assert Money.scale_cents(100000, 7.5, 1200) == 625
+    assert Money.scale_cents(2 * 10 ** 13, 3, 1) == 6 * 10 ** 13 # beyond the float fast path
+    rng = random.Random(5)
+    for _ in range(20000):
+        cents, rate = rng.randrange(-10 ** 9, 10 ** 9), rng.choice((1.5, 2, 2.5, 3.75, 5, 7.2, 0.1))
+        exact = (Decimal(cents) * Decimal(repr(rate)) / 1200).to_integral_value(ROUND_HALF_EVEN)
+        assert Money.scale_cents(cents, rate, 1200) == int(exact), (cents, rate)
+
+
+def test_scaled_array_matches_scale_cents():
+    numpy = pytest.importorskip("numpy")
+    rng = random.Random(6)
+    cents = [rng.randrange(-10 ** 10, 10 ** 10) for _ in range(5000)] + [25, 35, -25, 12 * 10 ** 11]
+    rates = [rng.choice((1.5, 2, 2.5, 3.75, 5, 7.2, 0.1)) for _ in cents]
+    assert Money.scaled_array(numpy, cents, rates, 1200) == [
+        Money.scale_cents(amount, rate, 1200) for amount, rate in zip(cents, rates)]
+    assert Money.scaled_array(numpy, [25, 35, -25], [1, 1, 1], 10) == [2, 4, -2]
+
+
+ACCOUNT_FILE = """Customer: Ann Lee
+Account Type: CheckingAccount
+Account Number: 1001
+Balance: -37.5
+Transaction History:
+2024-01-02 09:30:00 - Deposit: 100.0
+2024-01-03 10:00:00 - Withdrawal (Overdraft): -135.0
+
+Account Type: SavingAccount
+Account Number: 1002
+Balance: 2020.83
+Transaction History:
+2024-01-05 12:00:00 - Deposit: 2000.0
+2024-02-01 00:00:00 - Interest Credit: 20.83
+
+Account Type: LoanAccount
+Account Number: 1003
+Balance: 4587.5
+Principal Amount: 5000.0
+Interest Rate: 10.0
+Loan Duration: 12
+Installments Paid: 1
+Transaction History:
+2024-02-01 00:00:00 - Loan Installment: -412.5
+
+"""
+
+
+def read_files(filenames):
+    contents = {}
+    for filename in filenames:
+        with open(filename) as file:
+            contents[filename] = file.read()
+    return contents
+
+
+def account_state(account):
+    rows = list(account.get_transaction_history().formatted_rows())
+    return type(account).__name__, account.account_number, account.balance, rows
+
+
+# text files -> snapshot -> text files gives the same files byte for byte
+def test_text_snapshot_text_round_trip(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("customers.txt", 'w') as file:
+        file.write(f"ann,{PasswordHasher.active.hash('password')},Ann,Lee,1 Mall Road\n")
+    with open("ann.txt", 'w') as file:
+        file.write(ACCOUNT_FILE)
+    originals = read_files(["customers.txt", "ann.txt"])
+    BankingSystem.export_snapshot("customers.txt", "bank.snapshot")
+    os.remove("customers.txt")
+    os.remove("ann.txt")
+    BankingSystem.import_snapshot("bank.snapshot", "customers.txt")
+    assert read_files(originals) == originals
+
+
+# a bank -> snapshot keeps every account field, loan terms and installments paid included
+# snapshot -> text files -> snapshot keeps everything the text format holds, and writes the same text files again
+def test_snapshot_text_snapshot_round_trip(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    customer = Customer("bob", PasswordHasher.active.hash("password"), "Bob", "Khan", "2 Canal Bank")
+    customer.accounts_loaded = True
+    customer.add_account(CheckingAccount("2001", 50.0, 500.0, 25.0))
+    customer.add_account(SavingAccount("2002", 1000.0, 2.5))
+    customer.add_account(LoanAccount("2003", 6000.0, 4.5, 24))
+    checking, saving, loan = customer.accounts
+    checking.deposit(12.34, quiet=True)
+    checking.withdraw(200, quiet=True) # into the credit limit
+    saving.credit_interest()
+    for _ in range(3):
+        loan.pay_installment()
+    banking_system = BankingSystem()
+    banking_system.customers = [customer]
+    banking_system.save_snapshot("a.snapshot")
+
+    restored = BankingSystem()
+    restored.load_snapshot("a.snapshot")
+    restored_customer = restored.get_customer_by_username("bob")
+    restored.load_account_details_from_file(restored_customer)
+    restored_checking, restored_saving, restored_loan = restored_customer.accounts
+    assert [account_state(account) for account in restored_customer.accounts] == [
+        account_state(account) for account in customer.accounts]
+    assert (restored_checking.credit_limit, restored_checking.overdraft_fee) == (Money.of(500), Money.of(25))
+    assert restored_saving.interest_rate == 2.5
+    assert (restored_loan.principal_amount, restored_loan.interest_rate, restored_loan.loan_duration,
+            restored_loan.installments_paid) == (Money.of(6000), 4.5, 24, 3)
+    assert restored_loan.payoff_quote() == restored_loan.balance == loan.balance
+
+    BankingSystem.import_snapshot("a.snapshot", "customers.txt")
+    text_files = read_files(["customers.txt", "bob.txt"])
+    BankingSystem.export_snapshot("customers.txt", "b.snapshot")
+    again = BankingSystem()
+    again.load_snapshot("b.snapshot")
+    again_customer = again.get_customer_by_username("bob")
+    again.load_account_details_from_file(again_customer)
+    assert [account_state(account) for account in again_customer.accounts] == [
+        account_state(account) for account in customer.accounts]
+    BankingSystem.import_snapshot("b.snapshot", "customers.txt")
+    assert read_files(text_files) == text_files
+
+
+def write_bank(accounts_text):
+    with open("customers.txt", 'w') as file:
+        file.write(f"ann,{PasswordHasher.active.hash('password')},Ann,Lee,1 Mall Road\n")
+    with open("ann.txt", 'w') as file:
+        file.write(accounts_text)
+    banking_system = BankingSystem("customers.txt")
+    return banking_system, banking_system.get_customer_by_username("ann")
+
+
+# a transaction line that does not parse fails the load, the customer stays unloaded and the file is kept
+def test_bad_transaction_line_fails_the_load(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    text = ACCOUNT_FILE.replace("Deposit: 2000.0", "Deposit: two thousand")
+    banking_system, customer = write_bank(text)
+    with pytest.raises(ValueError):
+        banking_system.load_account_details_from_file(customer)
+    assert not customer.accounts_loaded and customer.accounts == []
+    assert banking_system.load_all_account_details() and read_files(["ann.txt"]) == {"ann.txt": text}
+
+
+# a loan keeps its terms in the text file, and month end carries on its schedule after loading
+def test_loan_terms_survive_the_text_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    banking_system, customer = write_bank(ACCOUNT_FILE)
+    banking_system.load_account_details_from_file(customer)
+    loan = customer.accounts[2]
+    assert (loan.principal_amount, loan.interest_rate, loan.loan_duration, loan.installments_paid, loan.balance) == (
+        Money.of(5000), 10, 12, 1, Money.of(4587.5))
+    assert banking_system.process_month_end() == (1, 1)
+    assert loan.installments_paid == 2
+    assert loan.balance == Money.of(4587.5) - (loan.monthly_payment - Money.of(4587.5).scaled(10, 1200))
+
+
+# files from before loan terms were kept: the first version's balances are minus the principal repaid and need
+# the principal added by hand, a positive balance is what is still owed over the rest of the default 12 months
+def test_loans_saved_without_terms_are_converted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    terms = "Principal Amount: 5000.0\nInterest Rate: 10.0\nLoan Duration: 12\nInstallments Paid: 1\n"
+    text = ACCOUNT_FILE.replace(terms, "").replace("Balance: 4587.5", "Balance: -412.5")
+    banking_system, customer = write_bank(text)
+    with pytest.raises(ValueError, match="Loan account 1003 was saved without its principal amount"):
+        banking_system.load_account_details_from_file(customer)
+    assert not customer.accounts_loaded and read_files(["ann.txt"]) == {"ann.txt": text}
+
+    banking_system, customer = write_bank(text.replace("Balance: -412.5\n", "Balance: -412.5\nPrincipal Amount: 5000.0\n"))
+    banking_system.load_account_details_from_file(customer)
+    loan = customer.accounts[2]
+    assert (loan.principal_amount, loan.interest_rate, loan.loan_duration, loan.installments_paid, loan.balance) == (
+        Money.of(5000), 10, 12, 1, Money.of(4587.5))
+    assert not loan.is_paid_off()
+
+    banking_system, customer = write_bank(ACCOUNT_FILE.replace(terms, ""))
+    banking_system.load_account_details_from_file(customer)
+    loan = customer.accounts[2]
+    assert (loan.principal_amount, loan.interest_rate, loan.loan_duration, loan.installments_paid, loan.balance) == (
+        Money.of(4587.5), 10, 11, 0, Money.of(4587.5))
+    banking_system.save_account_details_to_file([customer], "customer_files")
+    assert terms.replace("5000.0", "4587.5").replace("12", "11").replace("Paid: 1", "Paid: 0") in read_files(
+        ["ann.txt"])["ann.txt"]
+
+
+# a history that cannot be read when it is first used leaves balances, histories and statistics as they were
+def test_unreadable_history_changes_nothing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    banking_system, customer = write_bank(ACCOUNT_FILE)
+    banking_system.load_account_details_from_file(customer)
+    checking, saving, loan = customer.accounts
+    with open("ann.txt", 'a') as file: # changed behind the bank's back
+        file.write("\n")
+    for post in (lambda: checking.deposit(10, quiet=True), lambda: saving.withdraw(10, quiet=True),
+                 saving.credit_interest, lambda: SavingAccount.credit_interest_batch([saving])):
+        with pytest.raises(IOError):
+            post()
+    assert (checking.balance, saving.balance) == (Money.of(-37.5), Money.of(2020.83))
+    assert not checking.dirty and not saving.dirty
+    assert checking.history.pending and saving.history.pending
+
+
+# the balance range covers every balance since loading, whether or not the counts were rebuilt from the history
+def test_statistics_after_loading_keep_the_balance_range(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    customer = Customer("bob", PasswordHasher.active.hash("password"), "Bob", "Khan", "2 Canal Bank")
+    customer.accounts_loaded = True
+    customer.add_account(CheckingAccount("2001", 100.0, 500.0, 0))
+    banking_system = BankingSystem()
+    banking_system.customers = [customer]
+    banking_system.save_snapshot("a.snapshot")
+    restored = BankingSystem()
+    restored.load_snapshot("a.snapshot")
+    restored_customer = restored.get_customer_by_username("bob")
+    restored.load_account_details_from_file(restored_customer)
+    fresh = CheckingAccount("2002", 100.0, 500.0, 0)
+    for account in (restored_customer.accounts[0], fresh):
+        account.withdraw(150, quiet=True)
+        account.deposit(200, quiet=True)
+    statistics, fresh_statistics = restored_customer.accounts[0].get_statistics(), fresh.get_statistics()
+    assert (statistics["min_balance"], statistics["max_balance"]) == (Money.of(-50), Money.of(150))
+    assert statistics["counts"] == fresh_statistics["counts"]
+    assert statistics["min_balance"] == fresh_statistics["min_balance"]
+
+    banking_system, ann = write_bank(ACCOUNT_FILE)
+    banking_system.load_account_details_from_file(ann)
+    saving = ann.accounts[1]
+    saving.withdraw(2000, quiet=True)
+    saving.deposit(100, quiet=True)
+    statistics = saving.get_statistics()
+    assert (statistics["min_balance"], statistics["max_balance"]) == (Money.of(20.83), Money.of(2020.83))
+    assert statistics["counts"] == {"Deposit": 2, "Interest Credit": 1, "Withdrawal": 1}
+
+
+# a new account number is checked against every customer file, loaded or not
+def test_new_account_number_is_unique_across_unloaded_customers(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    banking_system, ann = write_bank(ACCOUNT_FILE)
+    bob = Customer("bob", "password", "Bob", "Khan", "2 Canal Bank")
+    banking_system.add_new_customer(bob)
+    with pytest.raises(ValueError):
+        bob.create_account("Checking", "1001", quiet=True, balance=10.0)
+    assert bob.accounts == [] and banking_system.duplicate_account_numbers == []
+    assert banking_system.get_account_by_number("1001") == (ann, ann.accounts[0])
+    bob.create_account("Checking", "2001", quiet=True, balance=10.0)
+    assert banking_system.get_account_by_number("2001") == (bob, bob.accounts[0])
+
+
+# while a customer file cannot be loaded no new account number is accepted, the file could hold it
+def test_new_account_number_waits_for_unreadable_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    banking_system, ann = write_bank(ACCOUNT_FILE.replace("CheckingAccount", "BrokenAccount"))
+    bob = Customer("bob", "password", "Bob", "Khan", "2 Canal Bank")
+    banking_system.add_new_customer(bob)
+    with pytest.raises(ValueError):
+        bob.create_account("Checking", "1001", quiet=True, balance=10.0)
+    assert bob.accounts == [] and not ann.accounts_loaded
+
+
+# serving banking_system on a Unix socket in the working directory while session(request) runs, then stopping it
+# request(**fields) sends one request and returns the reply
+def run_server_session(server, session):
+    async def run():
+        serving = asyncio.create_task(server.serve(path="bank.sock"))
+        while not os.path.exists("bank.sock"):
+            await asyncio.sleep(0.01)
+        reader, writer = await asyncio.open_unix_connection("bank.sock")
+
+        async def request(**fields):
+            writer.write(json.dumps(fields).encode() + b"\n")
+            await writer.drain()
+            return json.loads(await reader.readline())
+
+        try:
+            return await session(request)
+        finally:
+            writer.close()
+            serving.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await serving
+    return asyncio.run(run())
+
+
+# a file error while serving a request is replied to, the session goes on
+def test_server_session_survives_file_errors(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    banking_system, ann = write_bank(ACCOUNT_FILE)
+
+    async def session(request):
+        replies = [await request(op="login", username="ann", password="password")]
+        with open("ann.txt", 'a') as file: # changed behind the server's back
+            file.write("\n")
+        replies.append(await request(op="deposit", account_number="1001", amount=10))
+        replies.append(await request(op="balance", account_number="1001"))
+        return replies
+
+    login, deposit, balance = run_server_session(BankingSystemServer(banking_system), session)
+    assert login["ok"] and not deposit["ok"] and "changed" in deposit["error"]
+    assert balance == {"ok": True, "balance": -37.5}
+
+
+# stopping the server closes the sessions still open, saves every change and empties the journal
+def test_server_stop_saves_open_sessions(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    banking_system, ann = write_bank(ACCOUNT_FILE)
+    journal = banking_system.open_journal("bank.journal")
+    server = BankingSystemServer(banking_system)
+
+    async def session(request): # never logs out
+        await request(op="login", username="ann", password="password")
+        return await request(op="deposit", account_number="1001", amount=100)
+
+    try:
+        assert run_server_session(server, session) == {"ok": True, "balance": 62.5}
+    finally:
+        journal.close()
+    assert server.io_pool is None and server.session_tasks == set()
+    assert os.path.getsize("bank.journal") == 0
+    restored = BankingSystem("customers.txt")
+    ann = restored.get_customer_by_username("ann")
+    restored.load_account_details_from_file(ann)
+    checking = ann.accounts[0]
+    assert checking.balance == Money.of(62.5)
+    assert [row[1:] for row in checking.get_transaction_history().formatted_rows()][-1] == ("Deposit", Money.of(100))
+
+
+def loaded_accounts(username):
+    banking_system = BankingSystem("customers.txt")
+    customer = banking_system.get_customer_by_username(username)
+    banking_system.load_account_details_from_file(customer)
+    return {account.account_number: account for account in customer.accounts}
+
+
+# journaling a deposit, a registration and a new account, then crashing before anything is saved
+def crash_with_journal():
+    banking_system, ann = write_bank(ACCOUNT_FILE)
+    journal = banking_system.open_journal("bank.journal")
+    try:
+        banking_system.load_account_details_from_file(ann)
+        ann.accounts[1].deposit(100, quiet=True)
+        bob = Customer("bob", "password", "Bob", "Khan", "2 Canal Bank")
+        banking_system.add_new_customer(bob)
+        bob.create_account("Savings", "2001", quiet=True, balance=50.0)
+        bob.accounts[0].deposit(25, quiet=True)
+        journal.wait()
+    finally:
+        journal.close() # the process dies here, nothing is saved and the journal is kept
+    return banking_system, ann
+
+
+def test_recover_journal_after_crash(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    crash_with_journal()
+    assert read_files(["ann.txt"]) == {"ann.txt": ACCOUNT_FILE} and not os.path.exists("bob.txt")
+
+    assert BankingSystem("customers.txt").recover_journal("bank.journal") == 4
+    assert os.path.getsize("bank.journal") == 0
+    saving = loaded_accounts("ann")["1002"]
+    assert saving.balance == Money.of(2120.83)
+    assert [row[1:] for row in saving.get_transaction_history().formatted_rows()][-1] == ("Deposit", Money.of(100))
+    bob_saving = loaded_accounts("bob")["2001"]
+    assert bob_saving.balance == Money.of(75) and len(bob_saving.get_transaction_history()) == 1
+    assert BankingSystem("customers.txt").recover_journal("bank.journal") == 0
+
+
+# transactions the files already hold are recognised by their position and not applied twice
+def test_recover_journal_skips_saved_transactions(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    banking_system, ann = crash_with_journal()
+    BankingSystem.save_changed_customer(ann) # saved, but the crash came before the journal was emptied
+    journal = TransactionJournal("bank.journal")
+    try:
+        ann.accounts[1].deposit(1, quiet=True) # and one more that only the journal has
+        journal.record_transaction(ann.accounts[1], 0, "Deposit", 100)
+        journal.wait()
+    finally:
+        journal.close()
+
+    BankingSystem("customers.txt").recover_journal("bank.journal")
+    saving = loaded_accounts("ann")["1002"]
+    assert saving.balance == Money.of(2121.83)
+    assert [row[1:] for row in saving.get_transaction_history().formatted_rows()][1:] == [
+        ("Interest Credit", Money.of(20.83)), ("Deposit", Money.of(100)), ("Deposit", Money.of(1))]
+
+
+# a line cut off by a crash while it was written is ignored, the lines before it are replayed
+def test_recover_journal_ignores_torn_last_line(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    crash_with_journal()
+    with open("bank.journal", 'a') as file:
+        file.write("1002\t3\t2200.0\t1700000000\tDepo")
+    BankingSystem("customers.txt").recover_journal("bank.journal")
+    assert loaded_accounts("ann")["1002"].balance == Money.of(2120.83)
+    assert loaded_accounts("bob")["2001"].balance == Money.of(75)
+
+
+# truncating to a sequence number keeps the lines journaled after it, and whether they hold a registration
+def test_journal_truncate_keeps_later_lines(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    journal = TransactionJournal("bank.journal", commit_window=0)
+    try:
+        journal.append("one\n")
+        journal.append("two\n")
+        sequence = journal.appended # a checkpoint starts here
+        journal.record_customer(Customer("bob", "hash", "Bob", "Khan", "2 Canal Bank"))
+        journal.append("four\n")
+        journal.truncate(sequence)
+        with open("bank.journal") as file:
+            lines = file.readlines()
+        assert len(lines) == 2 and lines[0].startswith("C\t") and lines[1] == "four\n"
+        assert journal.customers_registered
+        journal.append("five\n")
+        journal.truncate(journal.appended - 1)
+        assert read_files(["bank.journal"]) == {"bank.journal": "five\n"} and not journal.customers_registered
+        journal.truncate(sequence) # already dropped
+        journal.truncate()
+        assert os.path.getsize("bank.journal") == 0
+    finally:
+        journal.close()
+
+
+# every record is applied or rejected with its reason, a rejected record changes nothing
+def test_process_transactions_rejections(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    banking_system, ann = write_bank(ACCOUNT_FILE)
+    banking_system.load_account_details_from_file(ann)
+    checking, saving, loan = ann.accounts
+    records = [
+        ("1002", "deposit", "10.005"),
+        ("1002", "withdraw", 0.5),
+        ("1002", "deposit", "0.001"),
+        ("1002", "deposit", "-5"),
+        ("1002", "deposit", "nan"),
+        ("1002", "deposit", "1e17"),
+        ("1002", "deposit", "ten"),
+        ("9999", "deposit", "10"),
+        ("1003", "deposit", "10"),
+        ("1001", "withdraw", "10"),
+        ("1002", "transfer", "10"),
+        ("1002", "deposit"),
+    ]
+    applied, rejections = banking_system.process_transactions(records)
+    assert applied == 2
+    assert [(number, reason) for number, _, reason in rejections] == [
+        (3, "Amount must be at least one cent."),
+        (4, "Amount must be positive."),
+        (5, "Amount must be positive."),
+        (6, "Amount is too large."),
+        (7, "Invalid amount."),
+        (8, "Account not found."),
+        (9, "Deposits and withdrawals are not allowed on Loan accounts."),
+        (10, "Insufficient balance with credit limit."),
+        (11, "Invalid operation."),
+        (12, "Malformed record."),
+    ]
+    assert saving.balance == Money.of(2030.33) and len(saving.get_transaction_history()) == 4
+    assert checking.balance == Money.of(-37.5) and len(checking.get_transaction_history()) == 2
+
+
+def test_password_hasher_verify_and_needs_rehash():
+    for hasher in (PasswordHasher("scrypt", cost=2 ** 4), PasswordHasher("pbkdf2_sha256", cost=1000)):
+        encoded = hasher.hash("secret")
+        assert hasher.verify("secret", encoded) and not hasher.verify("Secret", encoded)
+        assert not hasher.needs_rehash(encoded)
+        assert PasswordHasher(hasher.algorithm, cost=hasher.cost * 2).needs_rehash(encoded)
+    assert PasswordHasher().verify("secret", "secret") and not PasswordHasher().verify("secret", "other")
+    assert PasswordHasher().needs_rehash("secret")
+
+
+# a damaged stored hash fails the check instead of raising
+def test_password_hasher_damaged_hashes():
+    hasher = PasswordHasher("scrypt", cost=2 ** 4)
+    encoded = hasher.hash("secret")
+    damaged = ["scrypt$abc", "scrypt$16$8$1$zz$00", encoded[:-1], encoded.replace("$16$", "$x$"),
+               "scrypt$3$8$1$00$00", "scrypt$16$8$99999999999999999999$00$00", "pbkdf2_sha256$1$2$00$00"]
+    for stored in damaged:
+        assert hasher.verify("secret", stored) is False, stored
+
+
+def test_password_hasher_migrate():
+    hasher = PasswordHasher("pbkdf2_sha256", cost=1000)
+    customers = [Customer(f"user{i}", f"password{i}", "First", "Last", "Street") for i in range(3)]
+    customers[0].password = hasher.hash("password0")
+    already_hashed = customers[0].password
+    assert hasher.migrate(customers) == 2
+    assert customers[0].password == already_hashed
+    assert all(hasher.verify(f"password{i}", customer.password) for i, customer in enumerate(customers))
+    assert hasher.migrate(customers) == 0
+
+
+# only a matching cached entry answers without deriving, entries expire and the cache is bounded
+def test_password_hasher_cache(monkeypatch):
+    hasher = PasswordHasher("pbkdf2_sha256", cost=1000, cache_size=2, cache_ttl=60.0)
+    derivations = []
+    derive = PasswordHasher.derive
+    monkeypatch.setattr(PasswordHasher, "derive",
+                        staticmethod(lambda *args: derivations.append(args[0]) or derive(*args)))
+    encoded = [hasher.hash(f"secret{i}") for i in range(3)]
+    derivations.clear()
+    assert hasher.verify("secret0", encoded[0]) and hasher.verify("secret0", encoded[0])
+    assert derivations == ["secret0"]
+    assert not hasher.verify("wrong", encoded[0]) # a wrong guess is derived, not answered from the cache
+    assert derivations == ["secret0", "wrong"]
+    assert hasher.verify("secret1", encoded[1]) and hasher.verify("secret2", encoded[2])
+    assert list(hasher.cache) == [encoded[1], encoded[2]] # the oldest entry was dropped
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    derivations.clear()
+    assert hasher.verify("secret2", encoded[2]) and derivations == ["secret2"]
+
+
+# --export-snapshot writes bank.snapshot, which the next runs start from while it is newer than customers.txt
+# --import-snapshot writes the text files back
+def test_main_snapshot_flags(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    write_bank(ACCOUNT_FILE)
+    assert main(["--export-snapshot"]) == 0
+    snapshot_time = os.path.getmtime("bank.snapshot")
+    for filename in ("customers.txt", "ann.txt"): # emptied, but older than the snapshot
+        with open(filename, 'w'):
+            pass
+        os.utime(filename, (snapshot_time - 10, snapshot_time - 10))
+    with open("batch.csv", 'w') as file:
+        file.write("account_number,op,amount\n1002,deposit,10\n")
+    assert main(["--batch", "batch.csv"]) == 0
+    assert "1 transactions applied" in capsys.readouterr().out
+    assert os.path.getmtime("customers.txt") == snapshot_time - 10 # nothing changed in the registry
+
+    assert main(["--import-snapshot"]) == 0
+    assert loaded_accounts("ann")["1002"].balance == Money.of(2030.83) # the deposit saved to text after the snapshot
+    assert loaded_accounts("ann")["1001"].balance == Money.of(-37.5)